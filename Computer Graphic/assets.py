@@ -0,0 +1,62 @@
+import collections
+
+import pygame
+
+# Fonts, rendered text and disc sprites shared by the game windows.
+#
+# Nothing is loaded at import: a font is opened the first time text in it is
+# drawn (SysFont scans the system fonts, which is slow), and kept. Rendered
+# text is cached on (text, font, size, color) with least-recently-used
+# eviction, so a timer or turn line that comes back costs a blit instead of a
+# render. Each disc color and radius is drawn once into a sprite; frames blit
+# it, pixel for pixel what pygame.draw.circle would give.
+
+TEXT_CACHE_SIZE = 256  # rendered text surfaces kept
+SPRITE_KEY = (255, 0, 255)  # transparent color around the discs, used by no piece
+
+_fonts = {}
+_texts = collections.OrderedDict()
+_sprites = {}
+
+
+def font(size, name=None):
+    # `name` is a system font for SysFont, None for pygame's default font
+    key = (name, size)
+    loaded = _fonts.get(key)
+    if loaded is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        loaded = _fonts[key] = pygame.font.SysFont(name, size) if name else pygame.font.Font(None, size)
+    return loaded
+
+
+def text(message, size, color, name=None):
+    # Antialiased text surface; callers must not draw on it
+    key = (message, name, size, color)
+    surface = _texts.get(key)
+    if surface is not None:
+        _texts.move_to_end(key)
+        return surface
+    surface = _texts[key] = font(size, name).render(message, True, color)
+    if len(_texts) > TEXT_CACHE_SIZE:
+        _texts.popitem(last=False)
+    return surface
+
+
+def disc(color, radius):
+    key = (color, radius)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((2 * radius, 2 * radius))
+        sprite.fill(SPRITE_KEY)
+        pygame.draw.circle(sprite, color, (radius, radius), radius)
+        sprite.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()  # same pixel format as the window, for fast blits
+        _sprites[key] = sprite
+    return sprite
+
+
+def draw_disc(screen, color, center, radius):
+    # Drop-in for pygame.draw.circle(screen, color, center, radius)
+    screen.blit(disc(color, radius), (center[0] - radius, center[1] - radius))
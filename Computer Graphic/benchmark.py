@@ -0,0 +1,318 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+# Benchmarks for the engine and renderer hot paths. Runs headless (SDL dummy
+# video driver), prints throughput with a statistical summary, saves results
+# as a JSON baseline and flags regressions against an earlier baseline.
+#
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json --threshold 0.1
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import connect4_rules
+import mcts
+import perft
+import reversi_batch
+import reversi_endgame
+from reversi_rules import ReversiRules
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = {}
+
+
+def benchmark(name, unit, setup):
+    # Registers a benchmark. The function gets the value returned by setup()
+    # and returns the number of operations it performed; setup runs once,
+    # outside the timing.
+    def register(func):
+        BENCHMARKS[name] = (func, unit, setup)
+        return func
+    return register
+
+
+def load_script(filename, module_name):
+    # The game scripts are not importable by name ("connect4 2_0.py")
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def reversi_positions(count=200, seed=1):
+    # Positions from random games, spread over opening, middle and endgame
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = ReversiRules()
+        while not game.is_game_over():
+            moves = game.get_valid_moves(game.current_player)
+            if not moves:
+                game.make_pass()
+                continue
+            game.place_tile(*rng.choice(moves))
+            if rng.random() < 0.1:
+                snapshot = ReversiRules()
+                snapshot.bitboards = game.bitboards[:]
+                snapshot.current_player = game.current_player
+                snapshot.hash = game.hash
+                positions.append(snapshot)
+    return positions[:count]
+
+
+def reversi_game_moves(seed=2):
+    rng = random.Random(seed)
+    game = ReversiRules()
+    moves = []
+    while not game.is_game_over():
+        options = game.get_valid_moves(game.current_player)
+        if not options:
+            game.make_pass()
+            moves.append(None)
+            continue
+        move = rng.choice(options)
+        game.place_tile(*move)
+        moves.append(move)
+    return moves
+
+
+def connect4_positions(count=200, seed=3):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = connect4_rules.create_board()
+        piece = 1
+        while board.playable_cells():
+            col = rng.choice([c for c in range(board.cols) if connect4_rules.is_valid_location(board, c)])
+            connect4_rules.drop_piece(board, connect4_rules.get_next_available_row(board, col), col, piece)
+            positions.append(board.copy())
+            if connect4_rules.winning_move(board, piece):
+                break
+            piece = 3 - piece
+    return positions[:count]
+
+
+@benchmark("reversi.get_valid_moves", "calls", reversi_positions)
+def bench_reversi_moves(positions):
+    for game in positions:
+        game.version += 1  # time the move generation, not the cache
+        game.get_valid_moves(game.current_player)
+    return len(positions)
+
+
+@benchmark("reversi.batch_legal_moves", "positions", lambda: reversi_batch.stack(reversi_positions(2000)))
+def bench_reversi_batch(setup):
+    boards, players = setup
+    reversi_batch.legal_moves(boards, players)
+    return len(boards)
+
+
+@benchmark("reversi.place_tile", "moves", reversi_game_moves)
+def bench_reversi_place(moves):
+    game = ReversiRules()
+    for move in moves:
+        if move is None:
+            game.make_pass()
+        else:
+            game.place_tile(*move)
+    return len(moves)
+
+
+@benchmark("connect4.winning_move", "calls", connect4_positions)
+def bench_connect4_win(boards):
+    for board in boards:
+        board.checked = [0, 0, 0]  # time the search for a line, not the cache
+        board.wins = [None, None, None]
+        connect4_rules.winning_move(board, 1)
+        connect4_rules.winning_move(board, 2)
+    return 2 * len(boards)
+
+
+@benchmark("connect4.get_next_available_row", "calls", connect4_positions)
+def bench_connect4_row(boards):
+    calls = 0
+    for board in boards:
+        for col in range(board.cols):
+            connect4_rules.get_next_available_row(board, col)
+        calls += board.cols
+    return calls
+
+
+@benchmark("reversi.perft", "nodes", lambda: 6)
+def bench_reversi_perft(depth):
+    return perft.perft_reversi(ReversiRules(), depth)
+
+
+@benchmark("connect4.perft", "nodes", lambda: 5)
+def bench_connect4_perft(depth):
+    return perft.perft_connect4(connect4_rules.create_board(), 1, depth)
+
+
+def endgame_positions(max_empties=12):
+    return [reversi_endgame.parse_position(text, side) for text, side, _ in reversi_endgame.SUITE
+            if text.count("-") <= max_empties]
+
+
+@benchmark("reversi.endgame", "nodes", endgame_positions)
+def bench_reversi_endgame(positions):
+    solver = reversi_endgame.EndgameSolver()
+    nodes = 0
+    for player, opponent in positions:
+        solver.solve_position(player, opponent)
+        nodes += solver.nodes
+    return nodes
+
+
+@benchmark("reversi.mcts", "playouts", lambda: 200)
+def bench_reversi_mcts(playouts):
+    engine = mcts.MCTS(seed=0)
+    engine.get_move(ReversiRules(), 1, 60, playouts=playouts)
+    return engine.playouts
+
+
+@benchmark("connect4.mcts", "playouts", lambda: 2000)
+def bench_connect4_mcts(playouts):
+    engine = mcts.MCTS(seed=0)
+    engine.get_move(connect4_rules.create_board(), 1, 60, playouts=playouts)
+    return engine.playouts
+
+
+def reversi_frames():
+    import pygame
+    reversi = load_script("reversi.py", "reversi_bench")
+    from dirty_render import DirtyRenderer
+    pygame.init()
+    layout = reversi.ReversiGame()
+    screen = pygame.display.set_mode((layout.screen_size, layout.screen_size + 40))
+    renderer = DirtyRenderer(screen, reversi.make_background(screen.get_size(), layout.tile_size))
+    games = []
+    for position in reversi_positions(60, seed=4):
+        game = reversi.ReversiGame()
+        game.bitboards, game.current_player = position.bitboards, position.current_player
+        games.append(game)
+    return renderer, games
+
+
+@benchmark("reversi.render", "frames", reversi_frames)
+def bench_reversi_render(setup):
+    # Consecutive frames over changing positions, as in play
+    renderer, games = setup
+    for game in games:
+        game.render(renderer)
+    return len(games)
+
+
+@benchmark("reversi.render_full", "frames", reversi_frames)
+def bench_reversi_render_full(setup):
+    # Worst case: every frame redraws the whole window
+    renderer, games = setup
+    for game in games:
+        renderer.invalidate()
+        game.render(renderer)
+    return len(games)
+
+
+def connect4_frames():
+    module = load_script("connect4 2_0.py", "connect4_2_0_bench")
+    module.init_display()
+    return module, connect4_positions(60, seed=5)
+
+
+@benchmark("connect4_2_0.draw_board", "frames", connect4_frames)
+def bench_connect4_draw(setup):
+    module, boards = setup
+    for i, board in enumerate(boards):
+        module.draw_board(board, None, 10 - i % 10, None, None, i % 2, (i * 37) % module.width)
+    return len(boards)
+
+
+def run_benchmark(name, repeats, min_time):
+    func, unit, make_setup = BENCHMARKS[name]
+    setup = make_setup()
+    func(setup)  # warm up
+
+    # Grow the batch until one run takes at least min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(setup)
+        if time.perf_counter() - start >= min_time:
+            break
+        loops *= 2
+
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ops = 0
+        for _ in range(loops):
+            ops += func(setup)
+        rates.append(ops / (time.perf_counter() - start))
+    return {
+        "unit": unit,
+        "median": statistics.median(rates),
+        "mean": statistics.mean(rates),
+        "stdev": statistics.stdev(rates) if len(rates) > 1 else 0.0,
+        "min": min(rates),
+        "max": max(rates),
+        "repeats": repeats,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Returns the names whose median throughput fell by more than `threshold`
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["median"]
+        change = (result["median"] - before) / before
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:36} {before:14,.0f} -> {result['median']:14,.0f} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engines and renderers")
+    parser.add_argument("--only", nargs="*", help="run only benchmarks whose name starts with one of these")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed run")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown before flagging, e.g. 0.1 = 10%%")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.only or any(name.startswith(p) for p in args.only)]
+    results = {}
+    for name in names:
+        result = run_benchmark(name, args.repeats, args.min_time)
+        results[name] = result
+        spread = result["stdev"] / result["mean"] if result["mean"] else 0.0
+        print(f"{name:36} {result['median']:14,.0f} {result['unit']}/s  (mean {result['mean']:,.0f} +- {spread:.1%}, min {result['min']:,.0f})")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,86 @@
 import pygame
 import sys
 import time
-pygame.font.init()  # Initialize the font module
+
+import assets
+import connect4_ai
+import mcts
+import profiler
+from connect4_ai import TURN_TIME
+from connect4_rules import board_geometry, create_board, winning_move
+from dirty_render import DirtyRenderer
+from game_records import GameRecorder
+from move_history import MoveHistory
+from search_worker import SearchScheduler
 
 # Define constants
-no_row = 6
-COLUMN_COUNT = 7
-SQUARESIZE = 100
-RADIUS = int(SQUARESIZE / 2 - 5)
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 WHITE = (255, 255, 255)
-MYFONT = pygame.font.SysFont("monospace", 33)
+FONT = "monospace"  # system font, opened by assets.text the first time it is drawn
+FONT_SIZE = 33
 CYAN = (0, 255, 255)
 GRAY = (169, 169, 169)
 LIGHT_BLUE = (173, 216, 230)  # New color for win messages
+POLL_TIME = 0.05  # seconds between checks on the computer's background search
+END_DELAY = 10  # seconds the result stays up before the play-again prompt
+TAKE_BACK_KEY = pygame.K_BACKSPACE
+REDO_KEY = pygame.K_r
+
+# Set the board geometry and the window layout that follows from it
+def set_geometry(rows, cols, connect):
+    global no_row, COLUMN_COUNT, CONNECT, SQUARESIZE, RADIUS, width, height, size
+    no_row, COLUMN_COUNT, CONNECT = rows, cols, connect
+    SQUARESIZE = min(100, 800 // max(no_row + 1, COLUMN_COUNT))  # shrink the cells so big boards still fit on screen
+    RADIUS = int(SQUARESIZE / 2 - 5)
+    width = COLUMN_COUNT * SQUARESIZE
+    height = (no_row + 1) * SQUARESIZE
+    size = (width, height)
+
+# The standard board until init_display is given another, so importing the
+# script does not depend on the command line
+set_geometry(*board_geometry([]))
+screen = None  # created by init_display, so the rules can be imported without a display
+
+# Initialize pygame and the game window, for a board of `geometry`
+# (rows, cols, connect) if given
+def init_display(geometry=None):
+    global screen
+    if geometry is not None:
+        set_geometry(*geometry)
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption("Connect Four")
+
+# Pre-render the empty board once; frames only redraw what changed on top of it
+def make_background():
+    background = pygame.Surface(size)
+    background.fill(BLACK)
+    for c in range(COLUMN_COUNT):
+        for r in range(no_row):
+            pygame.draw.rect(background, BLUE, (c * SQUARESIZE, r * SQUARESIZE + SQUARESIZE, SQUARESIZE, SQUARESIZE))
+            pygame.draw.circle(background, BLACK, (int(c * SQUARESIZE + SQUARESIZE / 2), int(r * SQUARESIZE + SQUARESIZE + SQUARESIZE / 2)), RADIUS)
+    return background
 
-# Initialize pygame
-pygame.init()
-
-# Set up the game window
-width = COLUMN_COUNT * SQUARESIZE
-height = (no_row + 1) * SQUARESIZE
-size = (width, height)
-screen = pygame.display.set_mode(size)
-pygame.display.set_caption("Connect Four")
+renderer = None
 
-# Create the game board
-def create_board():
-    board = [[0 for _ in range(COLUMN_COUNT)] for _ in range(no_row)]
-    return board
+def get_renderer():
+    global renderer
+    if renderer is None:
+        renderer = DirtyRenderer(screen, make_background())
+    return renderer
 
-# Draw the game board
+# Draw the game board, returns the rectangles that changed on screen
 def draw_board(board, winner_coords=None, timer=None, message=None, prompt=None, turn=0, posx=None):
-    screen.fill(BLACK)  # Clear the screen once at the beginning of each loop
-    
-    # Draw the game board and the circles for the tokens
-    for c in range(COLUMN_COUNT):
-        for r in range(no_row):
-            pygame.draw.rect(screen, BLUE, (c * SQUARESIZE, r * SQUARESIZE + SQUARESIZE, SQUARESIZE, SQUARESIZE))
-            pygame.draw.circle(screen, BLACK, (int(c * SQUARESIZE + SQUARESIZE / 2), int(r * SQUARESIZE + SQUARESIZE + SQUARESIZE / 2)), RADIUS)
+    renderer = get_renderer()
+    renderer.begin()
     
-    # Draw the tokens and their colors
+    # Draw the tokens and their colors, skipping cells that look the same as last frame
     for c in range(COLUMN_COUNT):
         for r in range(no_row):
-            piece = board[r][c]
+            piece = board.piece_at(r, c)
             
             # Determine the color of the piece
             if winner_coords and (r, c) in winner_coords:
@@ -56,170 +90,210 @@ def draw_board(board, winner_coords=None, timer=None, message=None, prompt=None,
             elif piece == 2:
                 color = YELLOW  # Yellow for PLAYER2
             else:
-                continue  # Skip empty spaces
+                color = None  # Empty space
             
             # Turn non-winning pieces grey
             if winner_coords and (r, c) not in winner_coords and piece != 0:
                 color = GRAY
             
-            pygame.draw.circle(screen, color, (int(c * SQUARESIZE + SQUARESIZE / 2), height - int(r * SQUARESIZE + SQUARESIZE / 2)), RADIUS)
+            cell = (c * SQUARESIZE, height - (r + 1) * SQUARESIZE, SQUARESIZE, SQUARESIZE)
+            if renderer.changed((r, c), color, cell) and color is not None:
+                assets.draw_disc(screen, color, (int(c * SQUARESIZE + SQUARESIZE / 2), height - int(r * SQUARESIZE + SQUARESIZE / 2)), RADIUS)
     
     # Show the message in the center of the screen if provided
-    if message:
-        message_text = MYFONT.render(message, 1, LIGHT_BLUE)  # Use LIGHT_BLUE for the win message
+    if message and renderer.changed("message", (message, prompt), screen.get_rect(), clear=False):
+        message_text = assets.text(message, FONT_SIZE, LIGHT_BLUE, FONT)  # Use LIGHT_BLUE for the win message
         screen.blit(message_text, (width // 2 - message_text.get_width() // 2, height // 2 - message_text.get_height() // 2))
 
-    # Show the play again prompt below the win message if provided
-    if prompt:
-        prompt_text = MYFONT.render(prompt, 1, LIGHT_BLUE)
-        screen.blit(prompt_text, (width // 2 - prompt_text.get_width() // 2, height // 2 + message_text.get_height() // 2 + 10))
-
-    # Show the timer for the current player
-    if timer is not None:
-        timer_text = MYFONT.render(f"{timer}s", 1, CYAN)
-        pygame.draw.rect(screen, BLACK, (0, 0, width, SQUARESIZE))  # Black rectangle for the timer area
-        screen.blit(timer_text, (width // 2 - timer_text.get_width() // 2, 10))
-
-    # Show the preview token over the column (if moving token)
-    if posx is not None:
-        pygame.draw.circle(screen, RED if turn == 0 else YELLOW, (posx, int(SQUARESIZE / 2)), RADIUS)
-
-# Check if a column is valid for a move
-def is_valid_location(board, col):
-    return board[no_row - 1][col] == 0
-
-# Get the next available row in a column
-def get_next_available_row(board, col):
-    for r in range(no_row):
-        if board[r][col] == 0:
-            return r
-
-# Drop a piece into the board
-def drop_piece(board, row, col, piece):
-    board[row][col] = piece
-
-# Check for a win condition
-def winning_move(board, piece):
-    winning_coords = []
-
-    # Check horizontal locations
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(no_row):
-            if board[r][c] == piece and board[r][c + 1] == piece and board[r][c + 2] == piece and board[r][c + 3] == piece:
-                winning_coords = [(r, c), (r, c + 1), (r, c + 2), (r, c + 3)]
-                return winning_coords
-
-    # Check vertical locations
-    for c in range(COLUMN_COUNT):
-        for r in range(no_row - 3):
-            if board[r][c] == piece and board[r + 1][c] == piece and board[r + 2][c] == piece and board[r + 3][c] == piece:
-                winning_coords = [(r, c), (r + 1, c), (r + 2, c), (r + 3, c)]
-                return winning_coords
-
-    # Check positively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(no_row - 3):
-            if board[r][c] == piece and board[r + 1][c + 1] == piece and board[r + 2][c + 2] == piece and board[r + 3][c + 3] == piece:
-                winning_coords = [(r, c), (r + 1, c + 1), (r + 2, c + 2), (r + 3, c + 3)]
-                return winning_coords
-
-    # Check negatively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(3, no_row):
-            if board[r][c] == piece and board[r - 1][c + 1] == piece and board[r - 2][c + 2] == piece and board[r - 3][c + 3] == piece:
-                winning_coords = [(r, c), (r - 1, c + 1), (r - 2, c + 2), (r - 3, c + 3)]
-                return winning_coords
-
-    return None
-
-# Main game loop
-def main():
-    board = create_board()
+        # Show the play again prompt below the win message if provided
+        if prompt:
+            prompt_text = assets.text(prompt, FONT_SIZE, LIGHT_BLUE, FONT)
+            screen.blit(prompt_text, (width // 2 - prompt_text.get_width() // 2, height // 2 + message_text.get_height() // 2 + 10))
+
+    # Show the timer for the current player and the preview token over the column (if moving token)
+    if renderer.changed("top", (timer, turn, posx), (0, 0, width, SQUARESIZE)):
+        if timer is not None:
+            timer_text = assets.text(f"{timer}s", FONT_SIZE, CYAN, FONT)
+            screen.blit(timer_text, (width // 2 - timer_text.get_width() // 2, 10))
+
+        if posx is not None:
+            assets.draw_disc(screen, RED if turn == 0 else YELLOW, (posx, int(SQUARESIZE / 2)), RADIUS)
+
+    return renderer.end()
+
+play_move = MoveHistory.play
+get_events = pygame.event.get
+
+# Stages timed with --stats (see profiler.py)
+STAGES = {"draw_board": "draw_board", "play_move": "play", "winning_move": "winning_move", "get_events": "events"}
+
+# Turns on --stats / --trace FILE instrumentation and returns the frame stats
+def start_stats():
+    trace = sys.argv[sys.argv.index("--trace") + 1] if "--trace" in sys.argv else None  # CSV line per frame
+    if "--stats" in sys.argv or trace is not None:
+        profiler.enable(trace)
+        profiler.instrument(sys.modules[__name__], STAGES)
+    return profiler.FrameStats(moves="play")
+
+# Blocks until an event arrives or `timeout` seconds pass (forever for None)
+# and returns every pending event, so an idle window sleeps instead of spinning
+def wait_events(timeout=None):
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(max(1, int(timeout * 1000)))
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + get_events()
+
+# Play one game, appended to `archive` if given; returns True to play
+# another, False to exit
+def play_game(stats, archive=None):
+    board = create_board(no_row, COLUMN_COUNT, CONNECT)
+    get_renderer().invalidate()  # a new game starts from a clean window
     game_over = False
+    quit_game = False
     turn = 0  # 0 for Red, 1 for Yellow
     last_time = time.time()
-    timer = 10  # 10 seconds for each player
+    timer = TURN_TIME  # 10 seconds for each player
+    ai = SearchScheduler() if "--ai" in sys.argv else None
+    engine = mcts.search_connect4 if "--mcts" in sys.argv else connect4_ai.search
+    if archive is not None:
+        board.recorder = GameRecorder(archive, board)
+    history = MoveHistory(board)  # every move goes through it, so Backspace takes moves back
+    result = None  # set when a player loses on time
     message = None
     prompt = None
     posx = None  # Store the x position of the preview token
+    dirty = True  # the window needs a redraw
+
+    # Drop a piece in `col` for the side to move, by a click or by the computer
+    def play(col):
+        nonlocal turn, winner_coords, message, prompt, game_over, last_time, dirty
+        if col is not None and not game_over and play_move(history, col):
+
+            winner_coords = winning_move(board, 1 if turn == 0 else 2)
+            if winner_coords:
+                message = f"PLAYER {('RED' if turn == 0 else 'YELLOW')} WINS!"
+                prompt = "Press Enter to Play Again"
+                game_over = True
+
+            turn += 1
+            turn = turn % 2  # Switch player
+
+            last_time = time.time()  # Reset the timer when the player makes a move
+            draw_board(board, winner_coords, timer, message, prompt, turn, posx)
+            dirty = True
 
     while not game_over:
+        # Sleep until an event, the next tick of the turn clock or the next
+        # look at the computer's search, whichever comes first
+        timeout = 1 - (time.time() - last_time) % 1 + 0.01
+        if ai is not None and turn == 1:
+            timeout = min(timeout, POLL_TIME)
+        events = wait_events(timeout)
+
+        stats.begin()
         winner_coords = None  # Default to no winner
         message = None  # Reset message for each loop
         prompt = None  # Reset prompt for each loop
 
-        for event in pygame.event.get():
+        for event in events:
+            stats.handle(event, get_renderer())
             if event.type == pygame.QUIT:
-                game_over = True
+                game_over = quit_game = True
             if event.type == pygame.MOUSEMOTION:
                 # Move the token across the board, update position (without flickering)
                 posx = event.pos[0]
-                
-            pygame.display.update()
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
+                dirty = True
+
+            # Take back a move (Backspace) or replay it (R); against the
+            # computer, step on to the next position where Red is to move
+            if event.type == pygame.KEYDOWN and event.key in (TAKE_BACK_KEY, REDO_KEY) and not game_over:
+                if ai is not None:
+                    ai.cancel()
+                step = history.undo if event.key == TAKE_BACK_KEY else history.redo
+                while step() and ai is not None and len(board.moves) % 2 == 1:
+                    pass
+                turn = len(board.moves) % 2
+                last_time = time.time()  # a fresh clock for the player to move
+                dirty = True
+
+            # Each click is played in turn, in order with the keys around it
+            if event.type == pygame.MOUSEBUTTONDOWN and not (ai is not None and turn == 1):
                 posx = event.pos[0]
-                col = int(posx // SQUARESIZE)
-
-                if is_valid_location(board, col):
-                    row = get_next_available_row(board, col)
-                    drop_piece(board, row, col, 1 if turn == 0 else 2)
-
-                    winner_coords = winning_move(board, 1 if turn == 0 else 2)
-                    if winner_coords:
-                        message = f"PLAYER {('RED' if turn == 0 else 'YELLOW')} WINS!"
-                        prompt = "Press Enter to Play Again"
-                        game_over = True
-
-                    turn += 1
-                    turn = turn % 2  # Switch player
+                play(int(posx // SQUARESIZE))
 
-                    last_time = time.time()  # Reset the timer when the player makes a move
-                    draw_board(board, winner_coords, timer, message, prompt, turn, posx)
-                    pygame.display.update()
+        # The computer plays Yellow when started with --ai, searching in the background
+        if ai is not None and turn == 1 and not game_over:
+            if not ai.searching:
+                ai.start(engine, board, 2, TURN_TIME - 1)
+            elif ai.poll():
+                play(ai.take_result())
+            elif time.time() - last_time >= TURN_TIME - 0.5:
+                play(ai.cancel())  # the turn timer is running out, play the best move so far
 
         # Track time for the current player
         elapsed_time = int(time.time() - last_time)
-        remaining_time = max(0, 10 - elapsed_time)  # 10 seconds limit
+        remaining_time = max(0, TURN_TIME - elapsed_time)  # 10 seconds limit
 
-        if remaining_time == 0:
+        if remaining_time == 0 and not game_over:
             message = f"PLAYER {('RED' if turn == 0 else 'YELLOW')} LOSES!"
             prompt = None  # No prompt for play again if the player loses
             game_over = True
-            pygame.display.update()
-
-        draw_board(board, winner_coords, remaining_time, message, prompt, turn, posx)
-
-        pygame.display.update()
-
-    # Wait 10 seconds before asking to play again
-    pygame.time.wait(10000)
+            result = 2 if turn == 0 else 1
+
+        # Redraw only when something on screen changed
+        if dirty or remaining_time != timer or message:
+            draw_board(board, winner_coords, remaining_time, message, prompt, turn, posx)
+            timer = remaining_time
+            dirty = False
+        stats.end(screen)
+
+    if ai is not None:
+        ai.close()
+    if board.recorder is not None:
+        board.recorder.finish(result)
+    if quit_game:
+        return False
+
+    # Leave the result up for END_DELAY seconds before asking to play again,
+    # still answering the window meanwhile
+    deadline = time.time() + END_DELAY
+    while time.time() < deadline:
+        for event in wait_events(deadline - time.time()):
+            if event.type == pygame.QUIT:
+                return False
 
     # Ask if the player wants to play again
-    play_again_prompt = MYFONT.render("Press Enter to Play Again", 1, LIGHT_BLUE)
+    play_again_prompt = assets.text("Press Enter to Play Again", FONT_SIZE, LIGHT_BLUE, FONT)
     screen.blit(play_again_prompt, (width // 2 - play_again_prompt.get_width() // 2, height // 2 + 60))
 
-    play_again_exit = MYFONT.render("or any key to Exit", 1, LIGHT_BLUE)
+    play_again_exit = assets.text("or any key to Exit", FONT_SIZE, LIGHT_BLUE, FONT)
     screen.blit(play_again_exit, (width // 2 - play_again_exit.get_width() // 2, height // 2 + 120))
 
     pygame.display.update()
 
-    waiting_for_input = True
-    while waiting_for_input:
-        for event in pygame.event.get():
+    while True:
+        for event in wait_events():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                return False
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    main()  # Restart the game
-                else:
-                    pygame.quit()
-                    sys.exit()
+                return event.key == pygame.K_RETURN  # Enter plays again, any other key exits
+
+# Main game loop: one game after another, without growing the stack
+def main():
+    stats = start_stats()
+    archive = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None  # append games to this file
+    while play_game(stats, archive):
+        pass
+    stats.close()
 
 # Start the game
 if __name__ == "__main__":
-    draw_board(create_board(), None, 10, None, 0, None)
-    main()
+    # Board geometry from the command line, e.g. "--rows 10 --cols 12 --connect 5"
+    init_display(board_geometry(sys.argv))
+    draw_board(create_board(no_row, COLUMN_COUNT, CONNECT), None, 10, None, 0, None)
+    profiler.run(main, sys.argv[sys.argv.index("--profile") + 1] if "--profile" in sys.argv else None)
     pygame.quit()
     sys.exit()
@@ -1,133 +1,204 @@
 import pygame
 import sys
-pygame.font.init()  # Initialize the font module
-
+import time
+
+import assets
+import connect4_ai
+import mcts
+import profiler
+from connect4_rules import board_geometry, create_board, winning_move
+from dirty_render import DirtyRenderer
+from game_records import GameRecorder
+from move_history import MoveHistory
+from search_worker import SearchScheduler
 
 # Define constants
-no_row = 6
-COLUMN_COUNT = 7
-SQUARESIZE = 100
-RADIUS = int(SQUARESIZE / 2 - 5)
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 WHITE = (255, 255, 255)
-MYFONT = pygame.font.SysFont("monospace", 65)
+FONT = "monospace"  # system font, opened by assets.text the first time it is drawn
+FONT_SIZE = 65
 CYAN =(0, 255, 255)
-
-# Initialize pygame
-pygame.init()
-
-# Set up the game window
-width = COLUMN_COUNT * SQUARESIZE
-height = (no_row + 1) * SQUARESIZE
-size = (width, height)
-screen = pygame.display.set_mode(size)
-pygame.display.set_caption("Connect Four")
-
-# Create the game board
-def create_board():
-    board = [[0 for _ in range(COLUMN_COUNT)] for _ in range(no_row)]
-    return board
-
-# Draw the game board
-def draw_board(board):
+AI_TIME = 5  # seconds the computer may think per move
+POLL_TIME = 0.05  # seconds between checks on the computer's background search
+END_DELAY = 3  # seconds the final position stays up before the window closes
+TAKE_BACK_KEY = pygame.K_BACKSPACE
+REDO_KEY = pygame.K_r
+
+# Set the board geometry and the window layout that follows from it
+def set_geometry(rows, cols, connect):
+    global no_row, COLUMN_COUNT, CONNECT, SQUARESIZE, RADIUS, width, height, size
+    no_row, COLUMN_COUNT, CONNECT = rows, cols, connect
+    SQUARESIZE = min(100, 800 // max(no_row + 1, COLUMN_COUNT))  # shrink the cells so big boards still fit on screen
+    RADIUS = int(SQUARESIZE / 2 - 5)
+    width = COLUMN_COUNT * SQUARESIZE
+    height = (no_row + 1) * SQUARESIZE
+    size = (width, height)
+
+# The standard board until init_display is given another, so importing the
+# script does not depend on the command line
+set_geometry(*board_geometry([]))
+screen = None  # created by init_display, so the rules can be imported without a display
+
+# Initialize pygame and the game window, for a board of `geometry`
+# (rows, cols, connect) if given
+def init_display(geometry=None):
+    global screen
+    if geometry is not None:
+        set_geometry(*geometry)
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption("Connect Four")
+
+# Pre-render the empty board once; frames only redraw what changed on top of it
+def make_background():
+    background = pygame.Surface(size)
+    background.fill(BLACK)
     for c in range(COLUMN_COUNT):
         for r in range(no_row):
-            pygame.draw.rect(screen, BLUE, (c*SQUARESIZE, r*SQUARESIZE + SQUARESIZE, SQUARESIZE, SQUARESIZE))
-            pygame.draw.circle(screen, BLACK, (int(c*SQUARESIZE + SQUARESIZE/2), int(r*SQUARESIZE + SQUARESIZE + SQUARESIZE/2)), RADIUS)
-    
+            pygame.draw.rect(background, BLUE, (c*SQUARESIZE, r*SQUARESIZE + SQUARESIZE, SQUARESIZE, SQUARESIZE))
+            pygame.draw.circle(background, BLACK, (int(c*SQUARESIZE + SQUARESIZE/2), int(r*SQUARESIZE + SQUARESIZE + SQUARESIZE/2)), RADIUS)
+    return background
+
+renderer = None
+
+def get_renderer():
+    global renderer
+    if renderer is None:
+        renderer = DirtyRenderer(screen, make_background())
+    return renderer
+
+# Draw the game board and the top row (the winner, or the preview token over
+# the column), only the regions that changed since the last call, in one
+# display update
+def draw_board(board, turn=0, posx=None, winner=None):
+    renderer = get_renderer()
+    renderer.begin()
     for c in range(COLUMN_COUNT):
         for r in range(no_row):
-            if board[r][c] == 1:
-                pygame.draw.circle(screen, RED, (int(c*SQUARESIZE + SQUARESIZE/2), height - int(r*SQUARESIZE + SQUARESIZE/2)), RADIUS)
-            elif board[r][c] == 2:
-                pygame.draw.circle(screen, YELLOW, (int(c*SQUARESIZE + SQUARESIZE/2), height - int(r*SQUARESIZE + SQUARESIZE/2)), RADIUS)
-
-# Check if a column is valid for a move
-def is_valid_location(board, col):
-    return board[no_row - 1][col] == 0
-
-# Get the next available row in a column
-def get_next_available_row(board, col):
-    for r in range(no_row):
-        if board[r][col] == 0:
-            return r
-
-# Drop a piece into the board
-def drop_piece(board, row, col, piece):
-    board[row][col] = piece
-
-# Check for a win condition
-def winning_move(board, piece):
-    # Check horizontal locations
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(no_row):
-            if board[r][c] == piece and board[r][c + 1] == piece and board[r][c + 2] == piece and board[r][c + 3] == piece:
-                return True
-
-    # Check vertical locations
-    for c in range(COLUMN_COUNT):
-        for r in range(no_row - 3):
-            if board[r][c] == piece and board[r + 1][c] == piece and board[r + 2][c] == piece and board[r + 3][c] == piece:
-                return True
-
-    # Check positively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(no_row - 3):
-            if board[r][c] == piece and board[r + 1][c + 1] == piece and board[r + 2][c + 2] == piece and board[r + 3][c + 3] == piece:
-                return True
-
-    # Check negatively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(3, no_row):
-            if board[r][c] == piece and board[r - 1][c + 1] == piece and board[r - 2][c + 2] == piece and board[r - 3][c + 3] == piece:
-                return True
-
-    return False
+            piece = board.piece_at(r, c)
+            cell = (c*SQUARESIZE, height - (r + 1)*SQUARESIZE, SQUARESIZE, SQUARESIZE)
+            if renderer.changed((r, c), piece, cell) and piece != 0:
+                assets.draw_disc(screen, RED if piece == 1 else YELLOW, (int(c*SQUARESIZE + SQUARESIZE/2), height - int(r*SQUARESIZE + SQUARESIZE/2)), RADIUS)
+    if renderer.changed("top", (winner, turn, posx), (0, 0, width, SQUARESIZE)):
+        if winner is not None:
+            label = assets.text(f"Player {('Red' if winner == 1 else 'Yellow')} wins!!", FONT_SIZE, CYAN, FONT)
+            screen.blit(label, (50, 10))
+        elif posx is not None:
+            assets.draw_disc(screen, RED if turn == 0 else YELLOW, (posx, int(SQUARESIZE / 2)), RADIUS)
+    return renderer.end()
+
+play_move = MoveHistory.play
+get_events = pygame.event.get
+
+# Stages timed with --stats (see profiler.py)
+STAGES = {"draw_board": "draw_board", "play_move": "play", "winning_move": "winning_move", "get_events": "events"}
+
+# Turns on --stats / --trace FILE instrumentation and returns the frame stats
+def start_stats():
+    trace = sys.argv[sys.argv.index("--trace") + 1] if "--trace" in sys.argv else None  # CSV line per frame
+    if "--stats" in sys.argv or trace is not None:
+        profiler.enable(trace)
+        profiler.instrument(sys.modules[__name__], STAGES)
+    return profiler.FrameStats(moves="play")
+
+# Blocks until an event arrives or `timeout` seconds pass (forever for None)
+# and returns every pending event, so an idle window sleeps instead of spinning
+def wait_events(timeout=None):
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(max(1, int(timeout * 1000)))
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + get_events()
 
 # Main game loop
 def main():
-    board = create_board()
+    board = create_board(no_row, COLUMN_COUNT, CONNECT)
     game_over = False
+    quit_game = False
     turn = 0  # 0 for Red, 1 for Yellow
+    posx = None  # x position of the preview token
+    winner = None
+    ai = SearchScheduler() if "--ai" in sys.argv else None
+    engine = mcts.search_connect4 if "--mcts" in sys.argv else connect4_ai.search
+    archive = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None  # append games to this file
+    if archive is not None:
+        board.recorder = GameRecorder(archive, board)
+    history = MoveHistory(board)  # every move goes through it, so Backspace takes moves back
+    stats = start_stats()
+
+    # Drop a piece in `col` for the side to move, by a click or by the computer
+    def play(col):
+        nonlocal turn, winner, game_over
+        if col is not None and not game_over and play_move(history, col):
+
+            if winning_move(board, 1 if turn == 0 else 2):
+                winner = 1 if turn == 0 else 2
+                game_over = True
+
+            turn += 1
+            turn = turn % 2  # Switch player
 
     while not game_over:
-        for event in pygame.event.get():
+        # Sleep until an event, or the next look at the computer's search
+        events = wait_events(POLL_TIME if ai is not None and turn == 1 else None)
+        stats.begin()
+        for event in events:
+            stats.handle(event, get_renderer())
             if event.type == pygame.QUIT:
-                game_over = True
+                game_over = quit_game = True
             if event.type == pygame.MOUSEMOTION:
-                pygame.draw.rect(screen, BLACK, (0, 0, width, SQUARESIZE))
+                posx = event.pos[0]  # drawn once after all the events
+
+            # Take back a move (Backspace) or replay it (R); against the
+            # computer, step on to the next position where Red is to move
+            if event.type == pygame.KEYDOWN and event.key in (TAKE_BACK_KEY, REDO_KEY) and not game_over:
+                if ai is not None:
+                    ai.cancel()
+                step = history.undo if event.key == TAKE_BACK_KEY else history.redo
+                while step() and ai is not None and len(board.moves) % 2 == 1:
+                    pass
+                turn = len(board.moves) % 2
+
+            # Each click is played in turn, in order with the keys around it
+            if event.type == pygame.MOUSEBUTTONDOWN and not (ai is not None and turn == 1):
                 posx = event.pos[0]
-                pygame.draw.circle(screen, RED if turn == 0 else YELLOW, (posx, int(SQUARESIZE / 2)), RADIUS)
-            pygame.display.update()
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                posx = event.pos[0]
-                col = int(posx // SQUARESIZE)
-
-                if is_valid_location(board, col):
-                    row = get_next_available_row(board, col)
-                    drop_piece(board, row, col, 1 if turn == 0 else 2)
-
-                    if winning_move(board, 1 if turn == 0 else 2):
-                        label = MYFONT.render(f"Player {('Red' if turn == 0 else 'Yellow')} wins!!", 1, CYAN if turn == 0 else CYAN)
-                        screen.blit(label, (50, 10))
-                        game_over = True
-
-                    turn += 1
-                    turn = turn % 2  # Switch player
-
-                    draw_board(board)
-                    pygame.display.update()
-
-                    if game_over:
-                        pygame.time.wait(3000)  # Wait 3 seconds before closing
+                play(int(posx // SQUARESIZE))
+
+        # The computer plays Yellow when started with --ai, searching in the background
+        if ai is not None and turn == 1 and not game_over:
+            if not ai.searching:
+                ai.start(engine, board, 2, AI_TIME)
+            elif ai.poll():
+                play(ai.take_result())
+
+        # One display update per pass through the loop, however many events it handled
+        draw_board(board, turn, posx, winner)
+        stats.end(screen)
+
+    if ai is not None:
+        ai.close()
+    stats.close()
+    if board.recorder is not None:
+        board.recorder.finish()
+
+    # Leave the winning position up for END_DELAY seconds before closing,
+    # still answering the window meanwhile
+    deadline = time.time() + END_DELAY
+    while time.time() < deadline and not quit_game:
+        for event in wait_events(deadline - time.time()):
+            if event.type == pygame.QUIT:
+                quit_game = True
 
 # Start the game
 if __name__ == "__main__":
-    draw_board(create_board())
-    main()
+    # Board geometry from the command line, e.g. "--rows 10 --cols 12 --connect 5"
+    init_display(board_geometry(sys.argv))
+    draw_board(create_board(no_row, COLUMN_COUNT, CONNECT))
+    profiler.run(main, sys.argv[sys.argv.index("--profile") + 1] if "--profile" in sys.argv else None)
     pygame.quit()
     sys.exit()
\ No newline at end of file
@@ -0,0 +1,164 @@
+import os
+import time
+
+from connect4_book import BOOK_PATH, OpeningBook
+
+# Computer player for Connect Four: negamax with alpha-beta pruning,
+# iterative deepening and a fixed-size transposition table.
+
+TURN_TIME = 10  # seconds per move, same as the timer in connect4 2_0.py
+WIN_SCORE = 1000000
+TABLE_SIZE = 1 << 18
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Connect4AI:
+    def __init__(self, table_size=TABLE_SIZE, book=None):
+        self.table_size = table_size
+        self.book = book  # optional OpeningBook, consulted before searching
+        self.table = [None] * table_size
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None
+
+    def column_order(self, board):
+        # Center columns first, they take part in the most lines
+        center = (board.cols - 1) / 2
+        return sorted(range(board.cols), key=lambda c: abs(c - center))
+
+    def evaluate(self, board, piece):
+        # Open threats are worth much more than central pieces
+        opponent = 2 if piece == 1 else 1
+        score = 0
+        score += 20 * board.threat_cells(piece).bit_count()
+        score -= 20 * board.threat_cells(opponent).bit_count()
+        center = board.bit(0, board.cols // 2) * ((1 << board.rows) - 1)
+        score += 3 * (board.bitboards[piece] & center).bit_count()
+        score -= 3 * (board.bitboards[opponent] & center).bit_count()
+        return score
+
+    def negamax(self, board, piece, depth, alpha, beta, empty):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and self.out_of_time():
+            raise SearchTimeout()
+
+        opponent = 2 if piece == 1 else 1
+        playable = board.playable_cells()
+        if not playable:
+            return 0, None
+
+        # Win right away if we can
+        wins = board.threat_cells(piece) & playable
+        if wins:
+            col, _ = divmod((wins & -wins).bit_length() - 1, board.column_bits)
+            return WIN_SCORE + empty, col
+
+        if depth == 0:
+            return self.evaluate(board, piece), None
+
+        alpha_orig = alpha
+        key = board.key()
+        slot = key % self.table_size
+        entry = self.table[slot]
+        tt_col = None
+        if entry is not None and entry[0] == key:
+            _, entry_depth, flag, entry_score, tt_col = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return entry_score, tt_col
+                if flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif flag == UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score, tt_col
+
+        # Blocking a single opponent threat is forced; two threats lose
+        forced = board.threat_cells(opponent) & playable
+        columns = self.column_order(board)
+        if forced:
+            block = divmod(forced.bit_length() - 1, board.column_bits)[0]
+            if forced & (forced - 1):
+                return -(WIN_SCORE + empty - 1), block  # lost anyway, block one of them
+            columns = [block]
+        elif tt_col is not None:
+            columns.remove(tt_col)
+            columns.insert(0, tt_col)
+
+        best_score = -WIN_SCORE * 2
+        best_col = None
+        for col in columns:
+            if not board.is_valid_location(col):
+                continue
+            row = board.get_next_available_row(col)
+            board.drop_piece(row, col, piece)
+            try:
+                score = -self.negamax(board, opponent, depth - 1, -beta, -alpha, empty - 1)[0]
+            finally:
+                board.remove_piece(row, col, piece)
+            if score > best_score:
+                best_score, best_col = score, col
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[slot] = (key, depth, flag, best_score, best_col)
+        return best_score, best_col
+
+    def out_of_time(self):
+        return time.perf_counter() > self.deadline or (self.stop is not None and self.stop.is_set())
+
+    def get_move(self, board, piece, time_limit=TURN_TIME - 1, progress=None, stop=None, max_depth=None):
+        # Iterative deepening until the time runs out or the game is solved.
+        # `progress(depth, col, score)` is called after every finished depth.
+        self.nodes = 0
+        self.deadline = time.perf_counter() + time_limit
+        self.stop = stop  # anything with is_set(), e.g. a multiprocessing.Event
+        empty = board.rows * board.cols - sum(board.heights)
+        best_col = next((c for c in self.column_order(board) if board.is_valid_location(c)), None)
+        if best_col is None:
+            return None  # board is full
+
+        if self.book is not None:
+            entry = self.book.probe(board)
+            if entry is not None and board.is_valid_location(entry[0]):
+                if progress is not None:
+                    progress(0, entry[0], entry[1])
+                return entry[0]
+
+        last_depth = empty if max_depth is None else min(empty, max_depth)
+        for depth in range(1, last_depth + 1):
+            try:
+                score, col = self.negamax(board, piece, depth, -WIN_SCORE * 2, WIN_SCORE * 2, empty)
+            except SearchTimeout:
+                break
+            if col is not None:
+                best_col = col
+            if progress is not None:
+                progress(depth, best_col, score)
+            if abs(score) >= WIN_SCORE:
+                break  # solved
+        return best_col
+
+
+def search(board, piece, time_limit=TURN_TIME - 1, progress=None, stop=None):
+    # Entry point for SearchScheduler: runs a fresh engine in the worker,
+    # using the opening book when one has been built
+    book = OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+    try:
+        return Connect4AI(book=book).get_move(board, piece, time_limit, progress, stop)
+    finally:
+        if book is not None:
+            book.close()
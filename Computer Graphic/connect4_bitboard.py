@@ -0,0 +1,223 @@
+# Connect Four board stored as one bitboard per player.
+#
+# Each column uses (rows + 1) bits, bottom row first, so bit
+# (col * (rows + 1) + row) is the cell at (row, col). The extra bit on top of
+# every column stays empty and stops lines from wrapping into the next column.
+#
+# Any size works (e.g. Connect-5 on 20x20); `connect` is the line length that
+# wins. winning_move only looks at lines through pieces dropped since it last
+# ran, so checking after every move costs the same on any board size.
+
+
+class Connect4Board:
+    def __init__(self, rows=6, cols=7, connect=4):
+        if not 2 <= connect <= max(rows, cols):
+            raise ValueError(f"cannot connect {connect} on a {rows}x{cols} board")
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.column_bits = rows + 1
+        self.bitboards = [0, 0, 0]  # indexed by piece: 1 for Red, 2 for Yellow
+        self.heights = [0] * cols  # next free row in each column
+        self.moves = []  # bit index of every piece, in the order dropped
+        self.checked = [0, 0, 0]  # moves already searched for a win, per piece
+        self.wins = [None, None, None]  # winning cells found for each piece
+        self.recorder = None  # game_records.GameRecorder fed by connect4_rules.drop_piece and play
+        self.bottom_mask = sum(1 << (c * self.column_bits) for c in range(cols))
+        self.board_mask = self.bottom_mask * ((1 << rows) - 1)
+
+        # Shift amounts for vertical, horizontal and the two diagonal directions
+        self.directions = [
+            self.column_bits,      # horizontal
+            1,                     # vertical
+            self.column_bits + 1,  # positively sloped diagonal
+            self.column_bits - 1,  # negatively sloped diagonal
+        ]
+
+        # For each direction: where the window of bits around a cell starts,
+        # the window that any line through the cell fits in, the possible
+        # line starts in that window, and the shifts that AND `connect` cells
+        need = connect - 1
+        folds = []
+        length = 1
+        while length < connect:
+            step = min(length, connect - length)
+            folds.append(step)
+            length += step
+        self.pad = need * max(self.directions)  # keeps the window shifts non-negative
+        self.lines = []
+        for d in self.directions:
+            span = need * d
+            starts = sum(1 << (i * d) for i in range(connect))
+            self.lines.append((d, self.pad - span, (1 << (2 * span + 1)) - 1, starts, [step * d for step in folds]))
+
+    def __getitem__(self, row):
+        # Allows the old board[r][c] style of reading. The row is a tuple, so
+        # board[r][c] = piece raises instead of changing a copy; pieces go in
+        # and out through drop_piece / remove_piece.
+        return tuple(self.piece_at(row, col) for col in range(self.cols))
+
+    def bit(self, row, col):
+        return 1 << (col * self.column_bits + row)
+
+    def piece_at(self, row, col):
+        bit = self.bit(row, col)
+        if self.bitboards[1] & bit:
+            return 1
+        if self.bitboards[2] & bit:
+            return 2
+        return 0
+
+    def is_valid_location(self, col):
+        return 0 <= col < self.cols and self.heights[col] < self.rows
+
+    def get_next_available_row(self, col):
+        if self.heights[col] < self.rows:
+            return self.heights[col]
+        return None
+
+    def drop_piece(self, row, col, piece):
+        index = col * self.column_bits + row
+        self.bitboards[piece] |= 1 << index
+        self.heights[col] = max(self.heights[col], row + 1)
+        self.moves.append(index)
+
+    def play(self, col):
+        # A recorded move for move_history.MoveHistory, for the side to move
+        # (Red first). Returns the delta take_back needs, or None if the
+        # column is full.
+        if not self.is_valid_location(col):
+            return None
+        row, piece = self.heights[col], 1 + len(self.moves) % 2
+        self.drop_piece(row, col, piece)
+        if self.recorder is not None:
+            self.recorder.move(col)
+        return row, col, piece
+
+    def take_back(self, delta):
+        self.remove_piece(*delta)
+        if self.recorder is not None:
+            self.recorder.take_back()
+
+    def remove_piece(self, row, col, piece):
+        # Undo of drop_piece for the top piece of a column
+        index = col * self.column_bits + row
+        self.bitboards[piece] &= ~(1 << index)
+        self.heights[col] = row
+
+        moves = self.moves
+        if moves[-1] == index:
+            moves.pop()
+            position = len(moves)
+        else:
+            position = moves.index(index)
+            del moves[position]
+        checked = self.checked
+        if checked[1] > position:
+            checked[1] = position
+        if checked[2] > position:
+            checked[2] = position
+        if self.wins[piece] is not None and (row, col) in self.wins[piece]:
+            self.wins[piece] = None
+
+    def key(self):
+        # Compact position key: occupied cells plus Red's cells, offset by the
+        # bottom row so that empty columns are distinguished from Yellow pieces
+        mask = self.bitboards[1] | self.bitboards[2]
+        return mask + self.bottom_mask + self.bitboards[1]
+
+    def winning_move(self, piece):
+        # Returns the winning cells or None. Only the lines through pieces
+        # dropped since the last call are checked: a line that did not exist
+        # then must run through one of them.
+        if self.wins[piece] is None:
+            bits = self.bitboards[piece]
+            i = self.checked[piece]
+            while i < len(self.moves):
+                index = self.moves[i]
+                if (bits >> index) & 1:
+                    self.wins[piece] = self.line_through(bits, index)
+                    if self.wins[piece] is not None:
+                        break
+                i += 1
+            self.checked[piece] = i
+        return self.wins[piece]
+
+    def line_through(self, bits, index):
+        # `connect` cells of `bits` in a row through the cell at `index`, or None
+        padded = bits << self.pad
+        for d, offset, window, starts, folds in self.lines:
+            # Bits around the cell, moved so that the cell sits at the middle of the window
+            runs = (padded >> (index + offset)) & window
+            for amount in folds:
+                runs &= runs >> amount
+            runs &= starts
+            if runs:
+                start = index + offset - self.pad + (runs & -runs).bit_length() - 1
+                return [self.coords(start + i * d) for i in range(self.connect)]
+        return None
+
+    def mirror_key(self):
+        # key() of the left-right mirrored position
+        key = self.key()
+        column_mask = (1 << self.column_bits) - 1
+        mirrored = 0
+        for col in range(self.cols):
+            column = (key >> (col * self.column_bits)) & column_mask
+            mirrored |= column << ((self.cols - 1 - col) * self.column_bits)
+        return mirrored
+
+    def canonical_key(self):
+        # Smaller of the key and its mirror image, and whether it was mirrored
+        key, mirrored = self.key(), self.mirror_key()
+        if mirrored < key:
+            return mirrored, True
+        return key, False
+
+    def copy(self):
+        board = Connect4Board(self.rows, self.cols, self.connect)
+        board.bitboards = self.bitboards[:]
+        board.heights = self.heights[:]
+        board.moves = self.moves[:]
+        board.checked = self.checked[:]
+        board.wins = self.wins[:]
+        return board
+
+    def playable_cells(self):
+        # The lowest empty cell of every column that is not full
+        mask = self.bitboards[1] | self.bitboards[2]
+        return (mask + self.bottom_mask) & self.board_mask
+
+    def threat_cells(self, piece):
+        # Empty cells that would complete a line for `piece`
+        bits = self.bitboards[piece]
+        if self.connect == 4:
+            # Unrolled for the standard game, the evaluation calls this a lot
+            cells = (bits << 1) & (bits << 2) & (bits << 3)
+            for d in self.directions[0:1] + self.directions[2:]:
+                pair = (bits << d) & (bits << (2 * d))
+                cells |= pair & (bits << (3 * d))
+                cells |= pair & (bits >> d)
+                pair = (bits >> d) & (bits >> (2 * d))
+                cells |= pair & (bits << d)
+                cells |= pair & (bits >> (3 * d))
+            return cells & self.board_mask & ~(self.bitboards[1] | self.bitboards[2])
+
+        # Vertical: only the cell on top of a run can complete it
+        need = self.connect - 1
+        cells = bits << 1
+        for i in range(2, need + 1):
+            cells &= bits << i
+        for d in self.directions[0:1] + self.directions[2:]:
+            # before[m] / after[m]: the m cells on that side are all `piece`
+            before, after = [-1], [-1]
+            for i in range(1, need + 1):
+                before.append(before[-1] & (bits << (i * d)))
+                after.append(after[-1] & (bits >> (i * d)))
+            for m in range(need + 1):
+                cells |= before[m] & after[need - m]
+        return cells & self.board_mask & ~(self.bitboards[1] | self.bitboards[2])
+
+    def coords(self, index):
+        col, row = divmod(index, self.column_bits)
+        return (row, col)
@@ -0,0 +1,83 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Connect Four opening book: best move and score for every early position,
+# keyed by Connect4Board.canonical_key() so mirror images share one entry.
+#
+# File layout (little endian):
+#   header  magic b"C4BK", version, rows, cols, entry count
+#   keys    count x uint64, sorted
+#   moves   count x int8, column in canonical orientation
+#   scores  count x int32, from the side to move
+#
+# The file is memory-mapped and the three arrays are numpy views over the
+# mapping, so opening the book copies nothing and a lookup is one binary
+# search. make_connect4_book.py builds the file.
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "connect4_book.bin")
+MAGIC = b"C4BK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHQ")
+
+
+def write_book(path, rows, cols, entries):
+    # `entries` maps canonical key -> (move, score)
+    keys = np.array(sorted(entries), dtype="<u8")
+    moves = np.array([entries[k][0] for k in keys.tolist()], dtype="i1")
+    scores = np.array([entries[k][1] for k in keys.tolist()], dtype="<i4")
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, len(keys)))
+        f.write(keys.tobytes())
+        f.write(moves.tobytes())
+        f.write(scores.tobytes())
+
+
+class OpeningBook:
+    def __init__(self, path=BOOK_PATH):
+        with open(path, "rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.rows, self.cols, count = HEADER.unpack_from(self.mapping)
+        if magic != MAGIC or version != VERSION:
+            self.mapping.close()
+            raise ValueError(f"{path} is not a version {VERSION} Connect Four book")
+
+        offset = HEADER.size
+        self.keys = np.frombuffer(self.mapping, dtype="<u8", count=count, offset=offset)
+        offset += 8 * count
+        self.moves = np.frombuffer(self.mapping, dtype="i1", count=count, offset=offset)
+        offset += count
+        self.scores = np.frombuffer(self.mapping, dtype="<i4", count=count, offset=offset)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.keys = self.moves = self.scores = None
+        self.mapping.close()
+
+    def probe(self, board):
+        # Returns (column, score) for the side to move, or None if not in the book
+        if (board.rows, board.cols, board.connect) != (self.rows, self.cols, 4):
+            return None  # books are built for four in a row on one board size
+        key, mirrored = board.canonical_key()
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or int(self.keys[i]) != key:
+            return None
+        col = int(self.moves[i])
+        if mirrored:
+            col = self.cols - 1 - col
+        return col, int(self.scores[i])
+
+    def lookup(self, board):
+        entry = self.probe(board)
+        return None if entry is None else entry[0]
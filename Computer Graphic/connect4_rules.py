@@ -0,0 +1,39 @@
+from connect4_bitboard import Connect4Board
+
+# Connect Four rules without any drawing, so they can be imported headless
+# (self-play, benchmarks, servers). Both connect4 scripts use these helpers.
+
+no_row = 6
+COLUMN_COUNT = 7
+CONNECT = 4
+
+
+# Board geometry from command line options such as "--rows 10 --cols 12 --connect 5"
+def board_geometry(argv):
+    geometry = []
+    for flag, default in (("--rows", no_row), ("--cols", COLUMN_COUNT), ("--connect", CONNECT)):
+        geometry.append(int(argv[argv.index(flag) + 1]) if flag in argv else default)
+    return tuple(geometry)
+
+# Create the game board
+def create_board(rows=no_row, cols=COLUMN_COUNT, connect=CONNECT):
+    board = Connect4Board(rows, cols, connect)
+    return board
+
+# Check if a column is valid for a move
+def is_valid_location(board, col):
+    return board.is_valid_location(col)
+
+# Get the next available row in a column
+def get_next_available_row(board, col):
+    return board.get_next_available_row(col)
+
+# Drop a piece into the board, and record the move if the game is being recorded
+def drop_piece(board, row, col, piece):
+    board.drop_piece(row, col, piece)
+    if board.recorder is not None:
+        board.recorder.move(col)
+
+# Check for a win condition, returns the winning cells or None
+def winning_move(board, piece):
+    return board.winning_move(piece)
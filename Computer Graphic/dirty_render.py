@@ -0,0 +1,52 @@
+import pygame
+
+# Dirty-rectangle drawing shared by the game windows.
+#
+# The static part of a window (board, grid, holes) is rendered once into a
+# background surface. Each frame only the regions whose state changed are
+# restored from the background, redrawn and passed to pygame.display.update.
+
+
+class DirtyRenderer:
+    def __init__(self, screen, background):
+        self.screen = screen
+        self.background = background
+        self.drawn = {}  # last state drawn for each region key
+        self.dirty = []
+        self.full = True
+
+    def invalidate(self):
+        # Forces a full redraw, e.g. after something was drawn over the window
+        self.drawn.clear()
+        self.full = True
+
+    def begin(self):
+        if self.full:
+            self.screen.blit(self.background, (0, 0))
+            self.dirty.append(self.screen.get_rect())
+            self.full = False
+
+    def clear(self, rect):
+        # Restores `rect` from the background and marks it for update
+        rect = pygame.Rect(rect)
+        self.screen.blit(self.background, rect, rect)
+        self.dirty.append(rect)
+
+    def changed(self, key, state, rect, clear=True):
+        # Returns True when region `key` has to be redrawn for `state`.
+        # With clear=False the region is drawn over what is already there.
+        if key in self.drawn and self.drawn[key] == state:
+            return False
+        self.drawn[key] = state
+        if clear:
+            self.clear(rect)
+        else:
+            self.dirty.append(pygame.Rect(rect))
+        return True
+
+    def end(self):
+        rects = self.dirty
+        self.dirty = []
+        if rects:
+            pygame.display.update(rects)
+        return rects
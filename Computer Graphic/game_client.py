@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+from game_server import PORT, GameServer
+
+# Localhost client for game_server.py. Every client joins a game, answers
+# each "turn" with a random legal move and reports how its games ended, so
+# running many at once is a load test of the server.
+#
+#   python game_client.py --sessions 1000 --variant connect4
+#   python game_client.py --local --sessions 2000 --variant both    server in this process
+
+
+async def play(host, port, variant, rng, games=1, think=0.0):
+    # Plays `games` games in a row on one connection; returns the "end" events
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send(message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+    results = []
+    moves = 0
+    try:
+        for _ in range(games):
+            await send({"op": "join", "variant": variant})
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("server closed the connection")
+                event = json.loads(line)
+                if event["event"] == "turn":
+                    if think:
+                        await asyncio.sleep(think)
+                    await send({"op": "move", "move": rng.choice(event["moves"])})
+                    moves += 1
+                elif event["event"] == "end":
+                    results.append(event)
+                    break
+                elif event["event"] == "error":
+                    raise RuntimeError(event["message"])
+        await send({"op": "quit"})
+    finally:
+        writer.close()
+    return results, moves
+
+
+async def load_test(host, port, variant, sessions, games, seed, think):
+    # Starts two clients per session; returns the tally of results and the move count
+    rng = random.Random(seed)
+    variants = ["connect4", "reversi"] if variant == "both" else [variant]
+    clients = []
+    for i in range(sessions):
+        chosen = variants[i % len(variants)]
+        for _ in range(2):
+            clients.append(play(host, port, chosen, random.Random(rng.getrandbits(32)), games, think))
+    tally = collections.Counter()
+    moves = 0
+    for results, count in await asyncio.gather(*clients):
+        moves += count
+        for event in results:
+            tally[(event["result"], event["reason"])] += 1
+    return tally, moves
+
+
+async def run(args):
+    server = None
+    host, port = args.host, args.port
+    if args.local:
+        game_server = GameServer(args.turn_time)
+        server = await game_server.serve(host, 0)
+        port = server.sockets[0].getsockname()[1]
+    try:
+        start = time.perf_counter()
+        tally, moves = await load_test(host, port, args.variant, args.sessions, args.games, args.seed, args.think)
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+    games = sum(tally.values()) // 2  # both players see every end
+    print(f"{games:,} games, {moves:,} moves in {elapsed:.2f}s "
+          f"({games / elapsed:,.0f} games/s, {moves / elapsed:,.0f} moves/s)")
+    for (result, reason), count in sorted(tally.items()):
+        print(f"  result {result} by {reason}: {count // 2:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Random-move clients for game_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--variant", choices=("connect4", "reversi", "both"), default="connect4")
+    parser.add_argument("--sessions", type=int, default=100, help="concurrent games")
+    parser.add_argument("--games", type=int, default=1, help="games per client connection")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds to wait before each move")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true", help="run the server in this process on a free port")
+    parser.add_argument("--turn-time", type=float, default=10, help="turn clock of the --local server")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
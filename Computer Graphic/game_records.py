@@ -0,0 +1,326 @@
+import argparse
+import array
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+
+from connect4_bitboard import Connect4Board
+from connect4_rules import create_board, drop_piece, get_next_available_row, is_valid_location
+from reversi_rules import ReversiRules
+
+# Compact game records for both games, stored back to back in an
+# append-only archive file.
+#
+# File layout (little endian):
+#   header   magic b"GREC", version
+#   records  one after another, each:
+#     variant, rows, cols, connect, result, flags (1 byte each), move count (uint16)
+#     moves    one byte per move: the column for Connect Four, the square
+#              index (row * size + col) for Reversi; Reversi passes are not
+#              stored, a player with no legal move passes
+#     times    with the TIMED flag, uint16 milliseconds spent on each move
+#
+# A move has to fit in its byte, so boards go up to 256 columns for Connect
+# Four and 16x16 for Reversi; GameRecorder refuses bigger boards up front.
+#
+# read_records() is a generator, so analysis streams an archive of any size
+# one record at a time, either through buffered reads or an mmap. Either way
+# an archive that ends partway through a record raises ValueError.
+#
+#   python game_records.py summary games.rec --openings 4
+
+MAGIC = b"GREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sB")
+RECORD_HEADER = struct.Struct("<BBBBBBH")
+
+CONNECT4, REVERSI = 0, 1
+VARIANT_NAMES = {CONNECT4: "connect4", REVERSI: "reversi"}
+UNFINISHED = 255  # result of a game that was abandoned; otherwise 0 draw, 1 or 2 the winner
+TIMED = 1  # flag: the record carries per-move times
+MOVE_CODES = 256  # moves are stored in one byte
+
+GameRecord = collections.namedtuple("GameRecord", "variant rows cols connect result moves times")
+
+
+class RecordWriter:
+    # Appends records to an archive, creating it if needed
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(self, record):
+        moves = bytes(record.moves)
+        flags = TIMED if record.times is not None else 0
+        self.file.write(RECORD_HEADER.pack(record.variant, record.rows, record.cols, record.connect,
+                                           record.result, flags, len(moves)))
+        self.file.write(moves)
+        if record.times is not None:
+            times = array.array("H", (min(t, 0xFFFF) for t in record.times))
+            if sys.byteorder == "big":
+                times.byteswap()
+            self.file.write(times.tobytes())
+
+
+class GameRecorder:
+    # Collects the moves of one game as they are played and appends the game
+    # to the archive when it ends. Attach it as `board.recorder` (Connect
+    # Four, called from connect4_rules.drop_piece) or `game.recorder`
+    # (Reversi, called from place_tile). Moves made and taken back through
+    # move_history.MoveHistory are recorded and removed as well.
+    def __init__(self, path, position):
+        self.path = path
+        self.position = position
+        if isinstance(position, Connect4Board):
+            self.header = (CONNECT4, position.rows, position.cols, position.connect)
+            codes = position.cols
+        else:
+            self.header = (REVERSI, position.size, position.size, 0)
+            codes = position.size * position.size
+        if codes > MOVE_CODES or max(self.header) > 255:
+            # Checked here rather than when a move does not fit, partway through the game
+            raise ValueError(f"a {self.header[1]}x{self.header[2]} board is too big to record in {path}")
+        self.moves = bytearray()
+        self.times = []
+        self.last_time = time.perf_counter()
+        self.finished = False
+
+    def move(self, code):
+        now = time.perf_counter()
+        self.moves.append(code)
+        self.times.append(round((now - self.last_time) * 1000))
+        self.last_time = now
+
+    def take_back(self):
+        # The last move was taken back in play (see move_history.py)
+        self.moves.pop()
+        self.times.pop()
+
+    def finish(self, result=None):
+        # Writes the game once; the result is worked out from the position
+        # unless given (e.g. a loss on time)
+        if self.finished:
+            return
+        self.finished = True
+        if result is None:
+            result = position_result(self.position)
+        with RecordWriter(self.path) as writer:
+            writer.write(GameRecord(*self.header, result, self.moves, self.times))
+
+
+def position_result(position):
+    # 1 or 2 for a winner, 0 for a draw, UNFINISHED if the game goes on
+    if isinstance(position, Connect4Board):
+        for piece in (1, 2):
+            if position.winning_move(piece):
+                return piece
+        return 0 if not position.playable_cells() else UNFINISHED
+    if not position.is_game_over():
+        return UNFINISHED
+    black, white = position.bitboards[1].bit_count(), position.bitboards[2].bit_count()
+    return 1 if black > white else 2 if white > black else 0
+
+
+def _truncated(path):
+    return ValueError(f"{path} ends partway through a game record")
+
+
+def _parse(data, offset, path):
+    # Yields the records in a buffer (bytes or mmap) from `offset` on
+    end = len(data)
+    while offset < end:
+        if end - offset < RECORD_HEADER.size:
+            raise _truncated(path)
+        variant, rows, cols, connect, result, flags, count = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if end - offset < (3 * count if flags & TIMED else count):
+            raise _truncated(path)
+        moves = data[offset:offset + count]
+        offset += count
+        times = None
+        if flags & TIMED:
+            times = array.array("H")
+            times.frombytes(data[offset:offset + 2 * count])
+            if sys.byteorder == "big":
+                times.byteswap()
+            offset += 2 * count
+        yield GameRecord(variant, rows, cols, connect, result, moves, times)
+
+
+def read_records(path, use_mmap=False):
+    # Streams the records of an archive one at a time
+    with open(path, "rb") as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} game record archive")
+        if use_mmap:
+            if os.fstat(f.fileno()).st_size == FILE_HEADER.size:
+                return  # no records, and an mmap cannot map past the end
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from _parse(data, FILE_HEADER.size, path)
+            return
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                raise _truncated(path)
+            variant, rows, cols, connect, result, flags, count = RECORD_HEADER.unpack(header)
+            moves = f.read(count)
+            if len(moves) < count:
+                raise _truncated(path)
+            times = None
+            if flags & TIMED:
+                data = f.read(2 * count)
+                if len(data) < 2 * count:
+                    raise _truncated(path)
+                times = array.array("H")
+                times.frombytes(data)
+                if sys.byteorder == "big":
+                    times.byteswap()
+            yield GameRecord(variant, rows, cols, connect, result, moves, times)
+
+
+def replay(record):
+    # Yields the position after each move, filling in Reversi passes.
+    # The same position object is updated in place.
+    if record.variant == CONNECT4:
+        board = create_board(record.rows, record.cols, record.connect)
+        piece = 1
+        for col in record.moves:
+            if not is_valid_location(board, col):
+                raise ValueError(f"illegal column {col} in record")
+            drop_piece(board, get_next_available_row(board, col), col, piece)
+            piece = 3 - piece
+            yield board
+    else:
+        game = ReversiRules(record.rows)
+        for square in record.moves:
+            if not game.has_valid_moves(game.current_player):
+                game.make_pass()
+            if not game.place_tile(*divmod(square, game.size)):
+                raise ValueError(f"illegal square {square} in record")
+            yield game
+
+
+# Analysis stages: each one sees every record once through add() and keeps
+# only running totals, so memory does not grow with the archive.
+
+class WinRates:
+    def __init__(self):
+        self.results = collections.defaultdict(collections.Counter)
+
+    def add(self, record):
+        self.results[VARIANT_NAMES[record.variant]][record.result] += 1
+
+    def report(self):
+        lines = []
+        for variant, counts in sorted(self.results.items()):
+            games = sum(counts.values())
+            lines.append(f"{variant}: {games:,} games, player 1 {counts[1] / games:.1%}, "
+                         f"player 2 {counts[2] / games:.1%}, draws {counts[0] / games:.1%}, "
+                         f"unfinished {counts[UNFINISHED]:,}")
+        return lines
+
+
+class Openings:
+    # Most played move sequences over the first `plies` moves and how they scored
+    def __init__(self, plies=4, top=10):
+        self.plies = plies
+        self.top = top
+        self.lines = collections.defaultdict(collections.Counter)
+
+    def add(self, record):
+        if len(record.moves) >= self.plies and record.result != UNFINISHED:
+            key = (VARIANT_NAMES[record.variant], bytes(record.moves[:self.plies]))
+            self.lines[key][record.result] += 1
+
+    def report(self):
+        lines = []
+        ranked = sorted(self.lines.items(), key=lambda item: -sum(item[1].values()))
+        for (variant, moves), counts in ranked[:self.top]:
+            games = sum(counts.values())
+            score = (counts[1] + 0.5 * counts[0]) / games
+            lines.append(f"{variant} {' '.join(map(str, moves)):24} {games:8,} games, player 1 scores {score:.1%}")
+        return lines
+
+
+class MoveTiming:
+    # Mean time per move by ply, from records that carry times
+    def __init__(self, plies=10):
+        self.plies = plies
+        self.totals = collections.defaultdict(lambda: [0, 0, 0])  # variant -> [moves, ms, max ms]
+        self.by_ply = collections.defaultdict(lambda: [[0, 0] for _ in range(plies)])
+
+    def add(self, record):
+        if record.times is None:
+            return
+        variant = VARIANT_NAMES[record.variant]
+        total = self.totals[variant]
+        total[0] += len(record.times)
+        total[1] += sum(record.times)
+        total[2] = max(total[2], max(record.times, default=0))
+        by_ply = self.by_ply[variant]
+        for ply, ms in enumerate(record.times[:self.plies]):
+            by_ply[ply][0] += 1
+            by_ply[ply][1] += ms
+
+    def report(self):
+        lines = []
+        for variant, (moves, ms, longest) in sorted(self.totals.items()):
+            if not moves:
+                continue
+            per_ply = " ".join(f"{total / count:.0f}" for count, total in self.by_ply[variant] if count)
+            lines.append(f"{variant}: {moves:,} timed moves, mean {ms / moves:.0f} ms, max {longest} ms; "
+                         f"first plies (ms): {per_ply}")
+        return lines
+
+
+def analyze(records, stages):
+    # Feeds every record to every stage in a single pass; returns the count
+    count = 0
+    for record in records:
+        for stage in stages:
+            stage.add(record)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a game record archive")
+    parser.add_argument("command", choices=("summary",))
+    parser.add_argument("archive")
+    parser.add_argument("--mmap", action="store_true", help="read through a memory map")
+    parser.add_argument("--variant", choices=sorted(VARIANT_NAMES.values()))
+    parser.add_argument("--openings", type=int, default=4, help="plies per opening line")
+    parser.add_argument("--top", type=int, default=10, help="opening lines to show")
+    args = parser.parse_args()
+
+    records = read_records(args.archive, args.mmap)
+    if args.variant is not None:
+        records = (r for r in records if VARIANT_NAMES[r.variant] == args.variant)
+    stages = [WinRates(), Openings(args.openings, args.top), MoveTiming()]
+    start = time.perf_counter()
+    count = analyze(records, stages)
+    elapsed = time.perf_counter() - start
+    for stage in stages:
+        for line in stage.report():
+            print(line)
+    print(f"{count:,} records in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
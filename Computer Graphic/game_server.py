@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import itertools
+import json
+
+from connect4_ai import TURN_TIME
+from connect4_rules import create_board, drop_piece, get_next_available_row, is_valid_location, winning_move
+from game_records import GameRecorder
+from reversi_rules import ReversiRules
+
+# Network play for both games: one asyncio event loop hosts every session,
+# so a single process handles thousands of games without a thread each.
+# Clients speak JSON lines over TCP:
+#
+#   client -> server   {"op": "join", "variant": "connect4"}
+#                      {"op": "move", "move": 3}           Connect Four column
+#                      {"op": "move", "move": [2, 4]}      Reversi row, col
+#                      {"op": "quit"}
+#   server -> client   {"event": "waiting"}
+#                      {"event": "start", "game": 7, "variant": "connect4", "player": 1, "clock": 10}
+#                      {"event": "turn", "moves": [...], "clock": 10}   sent to the player to move
+#                      {"event": "move", "player": 1, "move": 3}
+#                      {"event": "pass", "player": 2}
+#                      {"event": "end", "result": 1, "reason": "win"}  result 0 is a draw
+#                      {"event": "error", "message": "..."}
+#
+# Every turn runs on a clock of TURN_TIME seconds, like the timer in
+# connect4 2_0.py; a player who runs out of time loses.
+#
+# Sessions only write to the players' streams. After each message the server
+# drains the streams of the sender and its game (never those of other
+# games), so a slow reader on either side of a game holds up that game only
+# rather than growing the server's buffers. Finished games are appended to
+# the record archive on a worker thread.
+#
+#   python game_server.py --port 8765
+#   python game_client.py --sessions 1000 --variant reversi
+
+PORT = 8765
+VARIANTS = ("connect4", "reversi")
+
+
+class Session:
+    # One game between two connected players, driven by their messages and
+    # a single call_later timer for the turn clock
+    def __init__(self, server, game_id, variant, players):
+        self.server = server
+        self.game_id = game_id
+        self.variant = variant
+        self.players = players  # [player 1, player 2]
+        self.to_move = 1
+        self.clock = None
+        if variant == "connect4":
+            self.position = create_board()
+        else:
+            self.position = ReversiRules()
+        if server.record is not None:
+            self.position.recorder = GameRecorder(server.record, self.position)
+        for number, player in enumerate(players, 1):
+            player.session, player.number = self, number
+            player.send({"event": "start", "game": game_id, "variant": variant, "player": number,
+                         "clock": server.turn_time})
+        self.next_turn()
+
+    def legal_moves(self):
+        if self.variant == "connect4":
+            return [col for col in range(self.position.cols) if is_valid_location(self.position, col)]
+        return self.position.get_valid_moves(self.to_move)
+
+    def broadcast(self, message):
+        for player in self.players:
+            player.send(message)
+
+    def next_turn(self):
+        if self.clock is not None:
+            self.clock.cancel()
+        self.clock = asyncio.get_running_loop().call_later(self.server.turn_time, self.out_of_time)
+        self.players[self.to_move - 1].send({"event": "turn", "moves": self.legal_moves(), "clock": self.server.turn_time})
+
+    def out_of_time(self):
+        # Runs as a timer callback, outside any connection's handler
+        self.clock = None
+        self.finish(3 - self.to_move, "time")
+        self.server.spawn(self.server.flush(self.players))
+
+    def play(self, player, move):
+        # Returns an error message, or None once the move is made
+        if player.number != self.to_move:
+            return "not your turn"
+        if self.variant == "connect4":
+            if not isinstance(move, int) or not is_valid_location(self.position, move):
+                return "illegal move"
+            drop_piece(self.position, get_next_available_row(self.position, move), move, self.to_move)
+            self.broadcast({"event": "move", "player": self.to_move, "move": move})
+            if winning_move(self.position, self.to_move):
+                return self.finish(self.to_move, "win")
+            if not self.position.playable_cells():
+                return self.finish(0, "draw")
+            self.to_move = 3 - self.to_move
+        else:
+            game = self.position
+            if not (isinstance(move, list) and len(move) == 2 and all(isinstance(x, int) for x in move)):
+                return "illegal move"
+            if not game.place_tile(*move):
+                return "illegal move"
+            self.broadcast({"event": "move", "player": self.to_move, "move": move})
+            if game.is_game_over():
+                black, white = game.bitboards[1].bit_count(), game.bitboards[2].bit_count()
+                return self.finish(1 if black > white else 2 if white > black else 0, "win" if black != white else "draw")
+            if not game.has_valid_moves(game.current_player):
+                game.make_pass()
+                self.broadcast({"event": "pass", "player": game.current_player ^ 3})
+            self.to_move = game.current_player
+        self.next_turn()
+        return None
+
+    def finish(self, result, reason):
+        if self.clock is not None:
+            self.clock.cancel()
+            self.clock = None
+        self.broadcast({"event": "end", "result": result, "reason": reason})
+        for player in self.players:
+            player.session = None
+        if self.position.recorder is not None:
+            self.server.spawn(self.server.save(self.position.recorder, result))
+        self.server.finished(self)
+        return None
+
+
+class Player:
+    # One client connection
+    def __init__(self, writer):
+        self.writer = writer
+        self.session = None
+        self.number = 0
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message).encode() + b"\n")
+
+
+class GameServer:
+    def __init__(self, turn_time=TURN_TIME, record=None):
+        self.turn_time = turn_time
+        self.record = record  # game record archive every finished game is appended to
+        self.waiting = {variant: None for variant in VARIANTS}
+        self.sessions = {}
+        self.game_ids = itertools.count(1)
+        self.games_played = 0
+        self.connections = 0
+        self.tasks = set()  # background flushes and saves, kept until done
+        self.record_lock = asyncio.Lock()  # one game appended to the archive at a time
+
+    def spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self, players):
+        # Drains the streams of `players` together; a connection that broke
+        # is left to its own handler
+        await asyncio.gather(*(player.writer.drain() for player in players), return_exceptions=True)
+
+    async def save(self, recorder, result):
+        # File I/O runs on a thread so the event loop keeps serving
+        async with self.record_lock:
+            await asyncio.to_thread(recorder.finish, result)
+
+    def finished(self, session):
+        del self.sessions[session.game_id]
+        self.games_played += 1
+
+    def join(self, player, variant):
+        if variant not in VARIANTS:
+            return f"unknown variant {variant!r}"
+        if player.session is not None or player in self.waiting.values():
+            return "already playing"
+        opponent = self.waiting[variant]
+        if opponent is None:
+            self.waiting[variant] = player
+            player.send({"event": "waiting"})
+        else:
+            self.waiting[variant] = None
+            game_id = next(self.game_ids)
+            self.sessions[game_id] = Session(self, game_id, variant, [opponent, player])
+        return None
+
+    def leave(self, player):
+        # The player quit or disconnected: free the queue slot or forfeit
+        for variant, waiting in self.waiting.items():
+            if waiting is player:
+                self.waiting[variant] = None
+        if player.session is not None:
+            player.session.finish(3 - player.number, "disconnect")
+
+    async def handle(self, reader, writer):
+        player = Player(writer)
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    op = message["op"]
+                except (ValueError, KeyError, TypeError):
+                    player.send({"event": "error", "message": "expected a JSON object with an op"})
+                    await self.flush([player])
+                    continue
+                session = player.session  # the game this message may end
+                if op == "join":
+                    error = self.join(player, message.get("variant"))
+                elif op == "move":
+                    error = "not in a game" if player.session is None else player.session.play(player, message.get("move"))
+                elif op == "quit":
+                    break
+                else:
+                    error = f"unknown op {op!r}"
+                if error is not None:
+                    player.send({"event": "error", "message": error})
+                # The sender, and both players of the game it was in or has joined
+                players = {player}
+                for game in (session, player.session):
+                    if game is not None:
+                        players.update(game.players)
+                await self.flush(players)
+        except ConnectionError:
+            pass
+        finally:
+            session = player.session
+            self.leave(player)  # may end the game, telling the opponent
+            if session is not None:
+                self.spawn(self.flush(session.players))
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=PORT):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def run(host, port, turn_time, record):
+    game_server = GameServer(turn_time, record)
+    server = await game_server.serve(host, port)
+    print(f"serving on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Connect Four and Reversi games over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--turn-time", type=float, default=TURN_TIME, help="seconds per move")
+    parser.add_argument("--record", help="append finished games to this game record archive")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.host, args.port, args.turn_time, args.record))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
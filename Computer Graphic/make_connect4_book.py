@@ -0,0 +1,86 @@
+import argparse
+import multiprocessing
+import time
+
+from connect4_ai import Connect4AI
+from connect4_book import BOOK_PATH, OpeningBook, write_book
+from connect4_rules import create_board, drop_piece, get_next_available_row, is_valid_location, winning_move
+
+# Offline generator for the Connect Four opening book. Searches every
+# position up to --plies moves deep (one entry per mirror pair) and writes
+# the result in the format read by connect4_book.OpeningBook.
+#
+#   python make_connect4_book.py --plies 6 --depth 12
+
+
+def collect_positions(plies):
+    # Unique positions reachable in at most `plies` moves, skipping won games.
+    # Every position has a fixed ply (its piece count), so one dict dedupes all.
+    positions = {}
+    frontier = [(create_board(), 1)]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for board, piece in frontier:
+            key, mirrored = board.canonical_key()
+            if key in positions:
+                continue
+            positions[key] = (board, piece, mirrored)
+            if ply == plies:
+                continue
+            for col in range(board.cols):
+                if not is_valid_location(board, col):
+                    continue
+                child = board.copy()
+                drop_piece(child, get_next_available_row(child, col), col, piece)
+                if not winning_move(child, piece):
+                    next_frontier.append((child, 3 - piece))
+        frontier = next_frontier
+    return positions
+
+
+_engine = None
+
+
+def solve(task):
+    # Runs in a pool worker; returns (key, canonical column, score)
+    global _engine
+    if _engine is None:
+        _engine = Connect4AI()
+    key, board, piece, mirrored, depth, time_limit = task
+    scores = []
+    col = _engine.get_move(board, piece, time_limit, progress=lambda d, c, s: scores.append(s), max_depth=depth)
+    if mirrored:
+        col = board.cols - 1 - col
+    return key, col, scores[-1] if scores else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Connect Four opening book")
+    parser.add_argument("--plies", type=int, default=6, help="book depth in moves from the empty board")
+    parser.add_argument("--depth", type=int, default=12, help="search depth for each book position")
+    parser.add_argument("--time-limit", type=float, default=60.0, help="cap in seconds per position")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--out", default=BOOK_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    positions = collect_positions(args.plies)
+    print(f"{len(positions)} positions up to {args.plies} plies")
+
+    tasks = [(key, board, piece, mirrored, args.depth, args.time_limit)
+             for key, (board, piece, mirrored) in positions.items()]
+    entries = {}
+    with multiprocessing.Pool(args.processes) as pool:
+        for done, (key, col, score) in enumerate(pool.imap_unordered(solve, tasks, 16), 1):
+            entries[key] = (col, score)
+            if done % 1000 == 0:
+                print(f"  {done}/{len(tasks)} searched")
+
+    board = create_board()
+    write_book(args.out, board.rows, board.cols, entries)
+    with OpeningBook(args.out) as book:
+        print(f"wrote {len(book)} entries to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
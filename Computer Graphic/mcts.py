@@ -0,0 +1,452 @@
+import argparse
+import math
+import multiprocessing
+import random
+import time
+
+import reversi_bitboard as bitboard
+from connect4_bitboard import Connect4Board
+from connect4_rules import create_board
+from reversi_rules import ReversiRules
+
+# Monte Carlo tree search (UCT) for both games, as an alternative to the
+# fixed-depth alpha-beta engines. The tree lives in parallel lists indexed by
+# node number instead of one object per node, the subtree under the move
+# actually played is kept for the next search, and with processes > 1 every
+# worker grows its own tree from the same root (root parallelization) and
+# the root visit counts are summed. Each worker process runs exactly one
+# share of every search, on the tree it kept from its previous share.
+#
+#   python mcts.py reversi --time 3 --processes 4
+#   python mcts.py connect4 --playouts 20000
+
+MCTS_TIME = 3  # seconds per move
+EXPLORATION = 1.4  # UCT exploration constant, about sqrt(2)
+MAX_NODES = 500000  # the tree stops growing here; playouts carry on
+PASS = -1  # Reversi move for a player who has no legal move
+
+
+class ReversiPlayouts:
+    # Reversi positions as (mover's discs, opponent's discs, mover) tuples,
+    # moves as square indices
+    def __init__(self, size):
+        self.spec = ("reversi", size)
+        self.size = size
+        self.geometry = bitboard.geometry(size)
+
+    def root(self, game, player):
+        return (game.bitboards[player], game.bitboards[3 - player], player)
+
+    def moves(self, state):
+        # Legal moves, [PASS] if the mover is stuck, [] once the game is over
+        player_bits, opponent_bits, _ = state
+        moves = bitboard.get_moves(player_bits, opponent_bits, self.geometry)
+        if moves:
+            return list(bitboard.iter_bits(moves))
+        if bitboard.get_moves(opponent_bits, player_bits, self.geometry):
+            return [PASS]
+        return []
+
+    def play(self, state, move):
+        player_bits, opponent_bits, player = state
+        if move == PASS:
+            return (opponent_bits, player_bits, 3 - player)
+        bit = 1 << move
+        flips = bitboard.get_flips(player_bits, opponent_bits, bit, self.geometry)
+        return (opponent_bits & ~flips, player_bits | flips | bit, 3 - player)
+
+    def playout(self, state, rng):
+        # Random moves to the end of the game; returns the winner, 0 for a tie
+        player_bits, opponent_bits, player = state
+        passed = False
+        while True:
+            moves = bitboard.get_moves(player_bits, opponent_bits, self.geometry)
+            if moves:
+                passed = False
+                for _ in range(rng.randrange(moves.bit_count())):
+                    moves &= moves - 1
+                bit = moves & -moves
+                flips = bitboard.get_flips(player_bits, opponent_bits, bit, self.geometry)
+                player_bits, opponent_bits = opponent_bits & ~flips, player_bits | flips | bit
+            elif passed:
+                break
+            else:
+                passed = True
+                player_bits, opponent_bits = opponent_bits, player_bits
+            player = 3 - player
+        diff = player_bits.bit_count() - opponent_bits.bit_count()
+        if diff == 0:
+            return 0
+        return player if diff > 0 else 3 - player
+
+    def move_value(self, move):
+        # The move as the game scripts use it: (row, col), or None for a pass
+        return None if move == PASS else divmod(move, self.size)
+
+
+class Connect4Playouts:
+    # Connect Four positions as (mover's pieces, all pieces, mover, winner)
+    # tuples, winner being None while the game goes on and 0 for a draw;
+    # moves are columns
+    def __init__(self, rows, cols, connect):
+        self.spec = ("connect4", rows, cols, connect)
+        self.board = Connect4Board(rows, cols, connect)  # geometry and line checks
+        self.columns = [((1 << rows) - 1) << (col * self.board.column_bits) for col in range(cols)]
+
+    def root(self, board, piece):
+        mask = board.bitboards[1] | board.bitboards[2]
+        winner = None
+        for p in (1, 2):
+            if board.winning_move(p):
+                winner = p
+        if winner is None and mask == board.board_mask:
+            winner = 0
+        return (board.bitboards[piece], mask, piece, winner)
+
+    def moves(self, state):
+        if state[3] is not None:
+            return []
+        board = self.board
+        playable = (state[1] + board.bottom_mask) & board.board_mask
+        return [col for col in range(board.cols) if playable & self.columns[col]]
+
+    def play(self, state, col):
+        bits, mask, piece, _ = state
+        board = self.board
+        bit = (mask + board.bottom_mask) & self.columns[col]
+        winner = None
+        if board.line_through(bits | bit, bit.bit_length() - 1):
+            winner = piece
+        elif mask | bit == board.board_mask:
+            winner = 0
+        return (mask & ~bits, mask | bit, 3 - piece, winner)
+
+    def playout(self, state, rng):
+        bits, mask, piece, winner = state
+        board = self.board
+        while winner is None:
+            playable = (mask + board.bottom_mask) & board.board_mask
+            for _ in range(rng.randrange(playable.bit_count())):
+                playable &= playable - 1
+            bit = playable & -playable
+            if board.line_through(bits | bit, bit.bit_length() - 1):
+                return piece
+            bits, mask, piece = mask & ~bits, mask | bit, 3 - piece
+            if mask == board.board_mask:
+                return 0
+        return winner
+
+    def move_value(self, move):
+        return move
+
+
+def playouts_for(position):
+    # Picks the rules adapter that matches a ReversiRules or Connect4Board
+    if isinstance(position, Connect4Board):
+        return Connect4Playouts(position.rows, position.cols, position.connect)
+    return ReversiPlayouts(position.size)
+
+
+class Tree:
+    # Nodes live in parallel lists indexed by node number. The children of a
+    # node are created together and sit next to each other, so a node only
+    # stores its first child and the child count; -1 means not expanded yet.
+    # wins[n] is counted for mover[n], the player whose move led to node n.
+    __slots__ = ("rules", "state", "move", "mover", "first_child", "child_count", "visits", "wins")
+
+    def __init__(self, rules, state):
+        self.rules = rules
+        self.state = state  # position at the root, node 0
+        self.move = [PASS]
+        self.mover = [3 - state[2]]
+        self.first_child = [-1]
+        self.child_count = [0]
+        self.visits = [0]
+        self.wins = [0.0]
+
+    def __len__(self):
+        return len(self.visits)
+
+    def expand(self, node, moves, mover):
+        self.first_child[node] = len(self.visits)
+        self.child_count[node] = len(moves)
+        for move in moves:
+            self.move.append(move)
+            self.mover.append(mover)
+            self.first_child.append(-1)
+            self.child_count.append(0)
+            self.visits.append(0)
+            self.wins.append(0.0)
+
+    def children(self, node):
+        start = self.first_child[node]
+        if start < 0:
+            return range(0)
+        return range(start, start + self.child_count[node])
+
+    def reroot(self, state):
+        # Looks for `state` at the root, its children and its grandchildren
+        # (our move and the reply). If found, that subtree becomes the whole
+        # tree and True is returned.
+        level = [(0, self.state)]
+        for _ in range(3):
+            for node, node_state in level:
+                if node_state == state:
+                    self.keep_subtree(node)
+                    self.state = state
+                    return True
+            level = [(child, self.rules.play(node_state, self.move[child]))
+                     for node, node_state in level for child in self.children(node)]
+        return False
+
+    def keep_subtree(self, root):
+        # Copies the subtree under `root` into fresh lists, breadth first so
+        # that siblings stay next to each other
+        if root == 0:
+            return
+        old = (self.move, self.mover, self.first_child, self.child_count, self.visits, self.wins)
+        move, mover, first_child, child_count, visits, wins = old
+        self.move, self.mover = [move[root]], [mover[root]]
+        self.first_child, self.child_count = [-1], [0]
+        self.visits, self.wins = [visits[root]], [wins[root]]
+        queue = [(root, 0)]
+        for old_node, new_node in queue:
+            start = first_child[old_node]
+            if start < 0:
+                continue
+            self.first_child[new_node] = len(self.visits)
+            self.child_count[new_node] = child_count[old_node]
+            for child in range(start, start + child_count[old_node]):
+                queue.append((child, len(self.visits)))
+                self.move.append(move[child])
+                self.mover.append(mover[child])
+                self.first_child.append(-1)
+                self.child_count.append(0)
+                self.visits.append(visits[child])
+                self.wins.append(wins[child])
+
+
+class MCTS:
+    def __init__(self, processes=1, exploration=EXPLORATION, max_nodes=MAX_NODES, seed=None):
+        self.processes = processes
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.rng = random.Random(seed)
+        self.tree = None
+        self.workers = None  # [(process, task queue)] with processes > 1
+        self.results = None  # (stats, playouts) or (None, error) from the workers
+        self.playouts = 0  # in the last search, over all processes
+        self.seconds = 0.0
+
+    @property
+    def playouts_per_second(self):
+        return self.playouts / self.seconds if self.seconds else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.workers is not None:
+            for process, tasks in self.workers:
+                tasks.put(None)
+            for process, tasks in self.workers:
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+            self.workers = None
+
+    def search(self, rules, state, time_limit, playouts=None, stop=None, progress=None):
+        # Runs playouts from `state` until the time or playout budget is used
+        # up and returns [(move, visits, wins)] for the root's children.
+        # Reuses the previous tree when `state` is one or two moves on from it.
+        if self.tree is None or self.tree.rules.spec != rules.spec or not self.tree.reroot(state):
+            self.tree = Tree(rules, state)
+        tree = self.tree
+        move, mover, first_child, child_count, visits, wins = (
+            tree.move, tree.mover, tree.first_child, tree.child_count, tree.visits, tree.wins)
+        rng = self.rng
+        exploration = self.exploration
+        deadline = time.perf_counter() + time_limit
+        next_report = time.perf_counter() + 0.25
+        done = 0
+
+        while playouts is None or done < playouts:
+            now = time.perf_counter()
+            if now > deadline or (stop is not None and stop.is_set()):
+                break
+            if progress is not None and now > next_report:
+                next_report = now + 0.25
+                best = self.best_child(tree)
+                if best is not None:
+                    progress(done, rules.move_value(move[best]), round(100 * wins[best] / max(visits[best], 1)))
+
+            # Selection: follow UCT down to a node that has not been tried yet
+            node, node_state = 0, tree.state
+            path = [0]
+            while True:
+                if first_child[node] < 0:
+                    if node != 0 and visits[node] == 0:
+                        break  # first visit: play out from here
+                    options = rules.moves(node_state)
+                    if not options:
+                        first_child[node] = 0  # game over, nothing to expand
+                        break
+                    if len(visits) + len(options) > self.max_nodes:
+                        break
+                    rng.shuffle(options)
+                    tree.expand(node, options, node_state[2])
+                count = child_count[node]
+                if count == 0:
+                    break
+                start = first_child[node]
+                log_visits = math.log(visits[node] + 1)
+                best, best_score = start, -1.0
+                for child in range(start, start + count):
+                    n = visits[child]
+                    if n == 0:
+                        best = child
+                        break
+                    score = wins[child] / n + exploration * math.sqrt(log_visits / n)
+                    if score > best_score:
+                        best, best_score = child, score
+                node = best
+                node_state = rules.play(node_state, move[node])
+                path.append(node)
+
+            # Simulation and backpropagation
+            winner = rules.playout(node_state, rng)
+            for node in path:
+                visits[node] += 1
+                if winner == mover[node]:
+                    wins[node] += 1.0
+                elif winner == 0:
+                    wins[node] += 0.5
+            done += 1
+
+        self.playouts = done
+        return [(move[child], visits[child], wins[child]) for child in tree.children(0)]
+
+    def start_workers(self):
+        self.results = multiprocessing.Queue()
+        self.workers = []
+        for _ in range(self.processes):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_serve_searches, daemon=True,
+                                              args=(tasks, self.results, self.exploration, self.max_nodes))
+            process.start()
+            self.workers.append((process, tasks))
+
+    def best_child(self, tree):
+        children = tree.children(0)
+        if not children:
+            return None
+        return max(children, key=lambda child: tree.visits[child])
+
+    def get_move(self, position, player, time_limit=MCTS_TIME, progress=None, stop=None, playouts=None):
+        # Returns a (row, col) square for Reversi or a column for Connect Four,
+        # None when the player has to pass or the game is over.
+        # `progress(playouts, move, win %)` is called a few times a second.
+        # `stop` is only watched by a single-process search.
+        rules = playouts_for(position)
+        state = rules.root(position, player)
+        options = rules.moves(state)
+        if not options or options == [PASS]:
+            return None
+
+        start = time.perf_counter()
+        if self.processes > 1:
+            if self.workers is None:
+                self.start_workers()
+            share = None if playouts is None else -(-playouts // self.processes)
+            # One task per worker, on its own queue, so no worker runs two
+            # shares back to back on the same tree
+            for process, tasks in self.workers:
+                tasks.put((rules, state, time_limit, share, self.rng.getrandbits(32)))
+            totals = {}
+            self.playouts = 0
+            for _ in self.workers:
+                stats, done = self.results.get()
+                if stats is None:
+                    self.close()
+                    raise RuntimeError(f"MCTS worker failed: {done}")
+                self.playouts += done
+                for move, visits, wins in stats:
+                    total = totals.setdefault(move, [0, 0.0])
+                    total[0] += visits
+                    total[1] += wins
+            stats = [(move, visits, wins) for move, (visits, wins) in totals.items()]
+        else:
+            stats = self.search(rules, state, time_limit, playouts, stop, progress)
+        self.seconds = time.perf_counter() - start
+
+        if not stats:
+            # Stopped before the first playout: any legal move beats none
+            return rules.move_value(options[0])
+        move, visits, wins = max(stats, key=lambda entry: entry[1])
+        if progress is not None:
+            progress(self.playouts, rules.move_value(move), round(100 * wins / max(visits, 1)))
+        return rules.move_value(move)
+
+
+def _serve_searches(tasks, results, exploration, max_nodes):
+    # Worker loop: one share of a search per task, until a None task. The
+    # engine and its tree stay with this worker from one search to the next.
+    engine = MCTS(exploration=exploration, max_nodes=max_nodes)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        rules, state, time_limit, playouts, seed = task
+        engine.rng.seed(seed)
+        try:
+            stats = engine.search(rules, state, time_limit, playouts)
+        except Exception as error:
+            results.put((None, repr(error)))
+        else:
+            results.put((stats, engine.playouts))
+
+
+_scheduler_engine = None
+
+
+def scheduler_engine():
+    # The engine of a SearchScheduler worker. The worker stays up between
+    # moves, so its tree is rerooted on the move played instead of regrown.
+    # It is a daemon process that cannot start processes of its own, so this
+    # engine runs in one process.
+    global _scheduler_engine
+    if _scheduler_engine is None:
+        _scheduler_engine = MCTS()
+    return _scheduler_engine
+
+
+def search_reversi(game, time_limit=MCTS_TIME, progress=None, stop=None):
+    # Entry point for SearchScheduler
+    return scheduler_engine().get_move(game, game.current_player, time_limit, progress, stop)
+
+
+def search_connect4(board, piece, time_limit=MCTS_TIME, progress=None, stop=None):
+    return scheduler_engine().get_move(board, piece, time_limit, progress, stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run MCTS from the start position and report playouts/sec")
+    parser.add_argument("variant", choices=("reversi", "connect4"))
+    parser.add_argument("--time", type=float, default=MCTS_TIME, help="seconds to search")
+    parser.add_argument("--playouts", type=int, default=None, help="stop after this many playouts")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    position = ReversiRules() if args.variant == "reversi" else create_board()
+    with MCTS(args.processes, seed=args.seed) as engine:
+        move = engine.get_move(position, 1, args.time, playouts=args.playouts)
+        print(f"best move {move}: {engine.playouts:,} playouts in {engine.seconds:.2f}s "
+              f"({engine.playouts_per_second:,.0f} playouts/s on {args.processes} process(es))")
+
+
+if __name__ == "__main__":
+    main()
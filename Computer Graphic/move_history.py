@@ -0,0 +1,67 @@
+# Undo / redo for a game in play, shared by both games. Each entry keeps
+# only the delta the move left on the position (the Connect Four cell, or
+# the Reversi square with its flipped discs and the previous hash), so
+# taking a move back or replaying it costs about as much as making it and no
+# board is ever copied. The position provides play(move), which returns the
+# delta or None for an illegal move, and take_back(delta):
+#
+#   Connect4Board   move: column, played for the side to move
+#   ReversiRules    move: (row, col), or None to pass
+#
+# snapshot() marks the current point in O(1) and restore() takes back every
+# move made since, one delta at a time: O(moves since the mark), with no
+# board copied. ReversiRules.snapshot() / restore() swap the whole position
+# in O(1) when the moves in between do not matter. Engines, hints and
+# analysis can branch off the game and come back:
+#
+#   mark = history.snapshot()
+#   history.play(move)
+#   ...
+#   history.restore(mark)
+
+
+class MoveHistory:
+    def __init__(self, position):
+        self.position = position
+        self.done = []  # (move, delta) for every move on the board, oldest first
+        self.undone = []  # moves taken back by undo(), the next one to redo last
+
+    def __len__(self):
+        return len(self.done)
+
+    def play(self, move):
+        # Makes a new move and forgets the moves that could be redone.
+        # Returns False if the move is illegal.
+        delta = self.position.play(move)
+        if delta is None:
+            return False
+        self.done.append((move, delta))
+        self.undone.clear()
+        return True
+
+    def undo(self):
+        # Takes back the last move; returns False if there is none
+        if not self.done:
+            return False
+        move, delta = self.done.pop()
+        self.position.take_back(delta)
+        self.undone.append(move)
+        return True
+
+    def redo(self):
+        # Plays the last move taken back again; returns False if there is none
+        if not self.undone:
+            return False
+        move = self.undone.pop()
+        self.done.append((move, self.position.play(move)))
+        return True
+
+    def snapshot(self):
+        return len(self.done)
+
+    def restore(self, mark):
+        # Takes back the moves made since snapshot() returned `mark`. They are
+        # not kept for redo: a branch that was looked at is simply dropped.
+        done = self.done
+        while len(done) > mark:
+            self.position.take_back(done.pop()[1])
@@ -0,0 +1,99 @@
+import argparse
+import sys
+import time
+
+from connect4_rules import create_board, drop_piece, get_next_available_row, is_valid_location, winning_move
+from reversi_rules import ReversiRules
+
+# Perft: counts every leaf of the game tree to a fixed depth from the start
+# position and checks the counts against known values. It goes through the
+# same rules API as the games, so it is a correctness gate for the move
+# generators and also gives a nodes/sec figure.
+#
+#   python perft.py reversi --depth 8
+#   python perft.py connect4 --depth 7
+
+# Reversi: a pass counts as a ply, a finished game counts as one leaf
+REVERSI_COUNTS = [1, 4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288, 24571284]
+
+# Connect Four on 7x6: a won or full board counts as one leaf
+CONNECT4_COUNTS = [1, 7, 49, 343, 2401, 16807, 117649, 823536, 5686266, 39452034]
+
+
+def perft_reversi(game, depth):
+    if depth == 0:
+        return 1
+    moves = game.get_valid_moves(game.current_player)
+    if not moves:
+        if not game.has_valid_moves(3 - game.current_player):
+            return 1  # game over
+        undo = game.make_pass()
+        nodes = perft_reversi(game, depth - 1)
+        game.unmake_move(undo)
+        return nodes
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for row, col in moves:
+        undo = game.make_move(row, col)
+        nodes += perft_reversi(game, depth - 1)
+        game.unmake_move(undo)
+    return nodes
+
+
+def perft_connect4(board, piece, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for col in range(board.cols):
+        if not is_valid_location(board, col):
+            continue
+        row = get_next_available_row(board, col)
+        drop_piece(board, row, col, piece)
+        if depth == 1 or winning_move(board, piece):
+            nodes += 1
+        else:
+            nodes += perft_connect4(board, 3 - piece, depth - 1)
+        board.remove_piece(row, col, piece)
+    if nodes == 0:
+        return 1  # board full
+    return nodes
+
+
+def run(variant, depth):
+    # Yields (depth, nodes, seconds, expected) for depths 1..depth
+    for d in range(1, depth + 1):
+        start = time.perf_counter()
+        if variant == "reversi":
+            nodes = perft_reversi(ReversiRules(), d)
+            reference = REVERSI_COUNTS
+        else:
+            nodes = perft_connect4(create_board(), 1, d)
+            reference = CONNECT4_COUNTS
+        expected = reference[d] if d < len(reference) else None
+        yield d, nodes, time.perf_counter() - start, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count game-tree leaves and check them against known values")
+    parser.add_argument("variant", choices=("reversi", "connect4"))
+    parser.add_argument("--depth", type=int, default=6)
+    args = parser.parse_args()
+
+    failed = False
+    for depth, nodes, seconds, expected in run(args.variant, args.depth):
+        if expected is None:
+            status = "no reference"
+        elif nodes == expected:
+            status = "ok"
+        else:
+            status = f"MISMATCH, expected {expected}"
+            failed = True
+        rate = nodes / seconds if seconds else float("inf")
+        print(f"depth {depth:2}: {nodes:12,} nodes {seconds:8.3f}s {rate:12,.0f} nodes/s  {status}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import cProfile
+import collections
+import pstats
+import time
+
+import pygame
+
+import assets
+
+# Instrumentation for the game loops.
+#
+# Nothing is on until a game's main() calls enable() (for --stats or
+# --trace FILE) and then instrument() on the functions it wants timed. From
+# then on those functions count their calls and time, and F3 toggles an
+# overlay with FPS, p50/p99 frame time, moves/sec and the numbers for each
+# stage; with a trace file it also writes one CSV line per frame. Until then
+# timed() hands back the function itself and the frame hooks return at once,
+# so the game runs the same code it would without instrumentation, and
+# importing a game never turns it on.
+#
+# run(main, FILE) runs the whole game under cProfile (--profile FILE), writes
+# the stats to FILE and prints the top functions (python -m pstats FILE to
+# dig further).
+#
+#   python reversi.py --stats
+#   python "connect4 2_0.py" --stats --trace frames.csv --profile game.prof
+
+ENABLED = False
+TRACE = None  # CSV file written by FrameStats, set by enable()
+WINDOW = 300  # frames kept for the frame-time percentiles
+REFRESH = 0.5  # seconds between overlay updates
+OVERLAY_KEY = pygame.K_F3
+OVERLAY_COLOR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0)
+
+STAGES = {}  # stage name -> [calls, seconds], totals since start
+
+
+def enable(trace=None):
+    # Turns instrumentation on; call it before instrument() and FrameStats()
+    global ENABLED, TRACE
+    ENABLED = True
+    TRACE = trace
+
+
+def instrument(owner, stages):
+    # Replaces owner.<attribute> (owner being a class or a module) with its
+    # timed() wrapper for each attribute -> stage name in `stages`
+    for attribute, name in stages.items():
+        setattr(owner, attribute, timed(name, getattr(owner, attribute)))
+
+
+def timed(name, func):
+    # Returns func wrapped to add its calls and time to stage `name`, or
+    # func itself when instrumentation is off
+    if not ENABLED:
+        return func
+    totals = STAGES.setdefault(name, [0, 0.0])
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[0] += 1
+            totals[1] += perf_counter() - start
+    return wrapper
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class FrameStats:
+    # Per-frame timing for one game loop: call begin() at the top of each
+    # frame, end() once it is drawn and handle(event) for every event.
+    # `moves` names the stage whose calls are the moves played.
+    def __init__(self, moves=None):
+        self.moves = moves
+        self.work = collections.deque(maxlen=WINDOW)  # seconds spent in each frame, without the tick sleep
+        self.starts = collections.deque(maxlen=WINDOW)
+        self.start = 0.0
+        self.visible = False
+        self.surface = None
+        self.updated = 0.0
+        self.snapshot = {}  # stage totals at the last overlay update
+        self.trace = None
+        self.trace_stages = {}
+        if TRACE is not None:
+            self.trace = open(TRACE, "w")
+            self.trace.write("frame_start_ms,frame_ms," + ",".join(f"{name}_calls,{name}_ms" for name in STAGES) + "\n")
+            self.trace_stages = {name: tuple(totals) for name, totals in STAGES.items()}
+
+    def begin(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+
+    def handle(self, event, renderer=None):
+        # F3 shows or hides the overlay; hiding it redraws what was under it
+        if ENABLED and event.type == pygame.KEYDOWN and event.key == OVERLAY_KEY:
+            self.visible = not self.visible
+            self.updated = 0.0
+            self.surface = None
+            if not self.visible and renderer is not None:
+                renderer.invalidate()
+
+    def end(self, screen):
+        if not ENABLED:
+            return
+        now = time.perf_counter()
+        self.work.append(now - self.start)
+        self.starts.append(self.start)
+        if self.trace is not None:
+            self.write_trace(now)
+        if self.visible:
+            if now - self.updated >= REFRESH:
+                self.surface = self.render_overlay(now)
+                self.updated = now
+            # Blitted every frame, as the game may have drawn over it
+            screen.blit(self.surface, (0, 0))
+            pygame.display.update(self.surface.get_rect())
+
+    def write_trace(self, now):
+        fields = [f"{self.start * 1000:.3f}", f"{(now - self.start) * 1000:.3f}"]
+        for name, (calls, seconds) in self.trace_stages.items():
+            totals = STAGES[name]
+            fields.append(str(totals[0] - calls))
+            fields.append(f"{(totals[1] - seconds) * 1000:.3f}")
+            self.trace_stages[name] = tuple(totals)
+        self.trace.write(",".join(fields) + "\n")
+
+    def report(self, now):
+        # The overlay text: frame rates over the window, stage rates since the last update
+        lines = []
+        if len(self.starts) > 1:
+            fps = (len(self.starts) - 1) / (self.starts[-1] - self.starts[0])
+            ordered = sorted(self.work)
+            lines.append(f"FPS {fps:5.1f}  frame p50 {percentile(ordered, 0.5) * 1000:.2f} ms  "
+                         f"p99 {percentile(ordered, 0.99) * 1000:.2f} ms")
+        elapsed = now - self.updated if self.updated else None
+        rates = {}
+        for name, (calls, seconds) in STAGES.items():
+            last_calls, last_seconds = self.snapshot.get(name, (0, 0.0))
+            if elapsed:
+                rates[name] = ((calls - last_calls) / elapsed, calls - last_calls, seconds - last_seconds)
+            self.snapshot[name] = (calls, seconds)
+        if self.moves in rates:
+            lines.append(f"moves/s {rates[self.moves][0]:.1f}")
+        for name, (per_second, calls, seconds) in rates.items():
+            mean = seconds / calls * 1000 if calls else 0.0
+            lines.append(f"{name:22} {per_second:9.1f}/s {mean:8.3f} ms")
+        return lines
+
+    def render_overlay(self, now):
+        # The numbers change every time, so the lines are rendered rather than cached
+        font = assets.font(22)
+        lines = self.report(now) or ["collecting..."]
+        texts = [font.render(line, True, OVERLAY_COLOR) for line in lines]
+        width = max(t.get_width() for t in texts) + 12
+        height = sum(t.get_height() for t in texts) + 12
+        if self.surface is not None:
+            # Never shrink while shown, so the last overlay is fully covered
+            width, height = max(width, self.surface.get_width()), max(height, self.surface.get_height())
+        surface = pygame.Surface((width, height))
+        surface.fill(OVERLAY_BACKGROUND)
+        y = 6
+        for text in texts:
+            surface.blit(text, (6, y))
+            y += text.get_height()
+        return surface
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+def run(main, profile_path=None):
+    # Calls main(), under cProfile writing to `profile_path` if one is given
+    if profile_path is None:
+        return main()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return main()
+    finally:
+        profile.disable()
+        profile.dump_stats(profile_path)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(25)
@@ -1,11 +1,21 @@
 import pygame
 import sys
-import numpy as np
+
+import assets
+import mcts
+import profiler
+import reversi_ai
+import reversi_bitboard as bitboard
+import reversi_patterns
+from dirty_render import DirtyRenderer
+from game_records import GameRecorder
+from move_history import MoveHistory
+from reversi_rules import BOARD_SIZE, ReversiRules
+from search_worker import SearchScheduler
 
 # Constants
-BOARD_SIZE = 8
-TILE_SIZE = 80
-SCREEN_SIZE = BOARD_SIZE * TILE_SIZE
+MAX_TILE_SIZE = 80
+MAX_BOARD_PIXELS = 720  # tiles shrink so big boards still fit on screen
 FPS = 60
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -13,182 +23,175 @@ GREEN = (0, 128, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 CYAN = (0, 255, 255)
+TAKE_BACK_KEY = pygame.K_BACKSPACE
+REDO_KEY = pygame.K_r
 
 # Colors for players
 PLAYER1_COLOR = BLACK
 PLAYER2_COLOR = WHITE
 
-# Directions for flipping tiles
-DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (-1, -1), (1, -1), (-1, 1)]
-
-class ReversiGame:
-    def __init__(self):
-        # Initialize game board: 0 for empty, 1 for black, 2 for white
-        self.board = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=int)
-        self.current_player = 1
-        
-        # Initial setup
-        self.board[3][3], self.board[4][4] = 2, 2  # White tiles
-        self.board[3][4], self.board[4][3] = 1, 1  # Black tiles
-
-    def draw_board(self, screen):
-        screen.fill(GREEN)
-        
-        # Draw grid
-        for x in range(0, SCREEN_SIZE, TILE_SIZE):
-            pygame.draw.line(screen, BLACK, (x, 0), (x, SCREEN_SIZE))
-            pygame.draw.line(screen, BLACK, (0, x), (SCREEN_SIZE, x))
-        
-        # Draw tiles
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                if self.board[row][col] != 0:
-                    color = PLAYER1_COLOR if self.board[row][col] == 1 else PLAYER2_COLOR
-                    pygame.draw.circle(screen, color, 
-                                       (col * TILE_SIZE + TILE_SIZE // 2, row * TILE_SIZE + TILE_SIZE // 2),
-                                       TILE_SIZE // 2 - 5)
-
-    def is_valid_move(self, row, col, player):
-        if self.board[row][col] != 0:
-            return False
-
-        opponent = 2 if player == 1 else 1
-        valid = False
-
-        for dx, dy in DIRECTIONS:
-            x, y = row + dx, col + dy
-            tiles_to_flip = []
-
-            while 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE and self.board[x][y] == opponent:
-                tiles_to_flip.append((x, y))
-                x += dx
-                y += dy
-
-            if tiles_to_flip and 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE and self.board[x][y] == player:
-                valid = True
-
-        return valid
-
-    def get_valid_moves(self, player):
-        valid_moves = []
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                if self.is_valid_move(row, col, player):
-                    valid_moves.append((row, col))
-        return valid_moves
-
-    def place_tile(self, row, col):
-        if not self.is_valid_move(row, col, self.current_player):
-            return False
-
-        opponent = 2 if self.current_player == 1 else 1
-        tiles_to_flip = []
-
-        for dx, dy in DIRECTIONS:
-            x, y = row + dx, col + dy
-            potential_flips = []
-
-            while 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE and self.board[x][y] == opponent:
-                potential_flips.append((x, y))
-                x += dx
-                y += dy
-
-            if potential_flips and 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE and self.board[x][y] == self.current_player:
-                tiles_to_flip.extend(potential_flips)
-
-        # Place the tile and flip captured tiles
-        self.board[row][col] = self.current_player
-        for x, y in tiles_to_flip:
-            self.board[x][y] = self.current_player
-
-        # Switch players
-        self.current_player = 2 if self.current_player == 1 else 1
-        return True
-
-    def get_winner(self):
-        black_count = np.sum(self.board == 1)
-        white_count = np.sum(self.board == 2)
-        if black_count > white_count:
-            return "Black wins!"
-        elif white_count > black_count:
-            return "White wins!"
-        else:
-            return "It's a tie!"
+def make_background(size, tile_size):
+    # Empty board with its grid, drawn once and reused by the renderer
+    background = pygame.Surface(size)
+    background.fill(GREEN)
+    board_size = size[0]
+    for x in range(0, board_size, tile_size):
+        pygame.draw.line(background, BLACK, (x, 0), (x, board_size))
+        pygame.draw.line(background, BLACK, (0, x), (board_size, x))
+    return background
+
+class ReversiGame(ReversiRules):
+    # Rules come from ReversiRules; this adds the pygame drawing
 
-    def has_valid_moves(self, player):
-        return len(self.get_valid_moves(player)) > 0
+    def __init__(self, size=BOARD_SIZE):
+        super().__init__(size)
+        self.tile_size = min(MAX_TILE_SIZE, MAX_BOARD_PIXELS // size)
+        self.screen_size = size * self.tile_size
 
     def display_winner_message(self, screen):
-        font = pygame.font.Font(None, 74)
         winner_message = self.get_winner()
-        text_surface = font.render(winner_message, True, CYAN)
-        text_rect = text_surface.get_rect(center=(SCREEN_SIZE // 2, SCREEN_SIZE // 2))
+        text_surface = assets.text(winner_message, 74, CYAN)
+        text_rect = text_surface.get_rect(center=(self.screen_size // 2, self.screen_size // 2))
         screen.blit(text_surface, text_rect)
         pygame.display.flip()
         pygame.time.wait(3000)
 
     def display_player_turn(self, screen):
-        font = pygame.font.Font(None, 36)
         player_message = f"Player {'Black' if self.current_player == 1 else 'White'}'s Turn"
-        text_surface = font.render(player_message, True, RED)
-        screen.blit(text_surface, (10, SCREEN_SIZE - 40))
+        text_surface = assets.text(player_message, 36, RED)
+        screen.blit(text_surface, (10, self.screen_size + 8))
+
+    def render(self, renderer):
+        # Redraws only the squares whose disc or move highlight changed since
+        # the last frame, plus the turn strip when the turn changes
+        renderer.begin()
+        player = self.current_player
+        highlights = self.valid_move_bits(player)
+        state = (self.bitboards[1], self.bitboards[2], highlights)
+        last = renderer.drawn.get("squares")
+        if last is None:
+            changed = self.geometry.full
+        else:
+            changed = (state[0] ^ last[0]) | (state[1] ^ last[1]) | (state[2] ^ last[2])
+        renderer.drawn["squares"] = state
+
+        tile = self.tile_size
+        for index in bitboard.iter_bits(changed):
+            row, col = divmod(index, self.size)
+            renderer.clear((col * tile, row * tile, tile, tile))
+            center = (col * tile + tile // 2, row * tile + tile // 2)
+            bit = 1 << index
+            if state[0] & bit:
+                assets.draw_disc(renderer.screen, PLAYER1_COLOR, center, tile // 2 - 5)
+            elif state[1] & bit:
+                assets.draw_disc(renderer.screen, PLAYER2_COLOR, center, tile // 2 - 5)
+            elif highlights & bit:
+                assets.draw_disc(renderer.screen, BLUE, center, 5)
+
+        if renderer.changed("turn", self.current_player, (0, self.screen_size, self.screen_size, 40)):
+            self.display_player_turn(renderer.screen)
+        return renderer.end()
 
-    def highlight_valid_moves(self, screen):
-        valid_moves = self.get_valid_moves(self.current_player)
-        for row, col in valid_moves:
-            pygame.draw.circle(screen, BLUE, 
-                               (col * TILE_SIZE + TILE_SIZE // 2, row * TILE_SIZE + TILE_SIZE // 2),
-                               5)
+
+get_events = pygame.event.get
+
+# Stages timed with --stats (see profiler.py)
+GAME_STAGES = {"play": "play", "get_valid_moves": "get_valid_moves", "valid_move_bits": "valid_move_bits",
+               "has_valid_moves": "has_valid_moves", "render": "render"}
+MODULE_STAGES = {"get_events": "events"}
 
 
 def main():
+    # Board size from the command line, e.g. "python reversi.py --size 10"
+    size = int(sys.argv[sys.argv.index("--size") + 1]) if "--size" in sys.argv else BOARD_SIZE
+    archive = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None  # append games to this file
+    trace = sys.argv[sys.argv.index("--trace") + 1] if "--trace" in sys.argv else None  # CSV line per frame
+    if "--stats" in sys.argv or trace is not None:
+        profiler.enable(trace)
+        profiler.instrument(ReversiGame, GAME_STAGES)
+        profiler.instrument(sys.modules[__name__], MODULE_STAGES)
+    game = ReversiGame(size)
+
     pygame.init()
-    screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE + 40))  # Extra space for turn display
+    screen = pygame.display.set_mode((game.screen_size, game.screen_size + 40))  # Extra space for turn display
     pygame.display.set_caption("Reversi")
     clock = pygame.time.Clock()
-    game = ReversiGame()
+    renderer = DirtyRenderer(screen, make_background(screen.get_size(), game.tile_size))
+    ai = SearchScheduler() if "--ai" in sys.argv else None  # computer plays White
+    engine = mcts.search_reversi if "--mcts" in sys.argv else reversi_ai.search
+    if "--patterns" in sys.argv:
+        # Learned evaluation (8x8 only); load the weights now so a missing file fails before play
+        reversi_patterns.weights()
+        engine = reversi_patterns.search
+    if archive is not None:
+        game.recorder = GameRecorder(archive, game)
+    history = MoveHistory(game)  # every move goes through it, so Backspace takes moves back
+    stats = profiler.FrameStats(moves="play")
 
     running = True
     game_over = False
 
     while running:
-        screen.fill(GREEN)
-        game.draw_board(screen)
-        game.highlight_valid_moves(screen)
-        game.display_player_turn(screen)
-        pygame.display.flip()
+        stats.begin()
+        game.render(renderer)
 
-        for event in pygame.event.get():
+        for event in get_events():
+            stats.handle(event, renderer)
             if event.type == pygame.QUIT:
                 running = False
 
-            if event.type == pygame.MOUSEBUTTONDOWN and not game_over:
+            # Take back a move (Backspace) or replay it (R); against the
+            # computer, step on to the next position where Black is to move
+            if event.type == pygame.KEYDOWN and event.key in (TAKE_BACK_KEY, REDO_KEY):
+                if ai is not None:
+                    ai.cancel()
+                step = history.undo if event.key == TAKE_BACK_KEY else history.redo
+                while step() and ai is not None and game.current_player == 2:
+                    pass
+                game_over = not (game.has_valid_moves(1) or game.has_valid_moves(2))
+
+            if event.type == pygame.MOUSEBUTTONDOWN and not game_over and not (ai is not None and game.current_player == 2):
                 x, y = pygame.mouse.get_pos()
-                if y < SCREEN_SIZE:
-                    row, col = y // TILE_SIZE, x // TILE_SIZE
+                if y < game.screen_size:
+                    row, col = y // game.tile_size, x // game.tile_size
 
-                    if game.place_tile(row, col):
+                    if history.play((row, col)):
                         # Update display immediately after a valid move
-                        screen.fill(GREEN)
-                        game.draw_board(screen)
-                        game.display_player_turn(screen)
-                        pygame.display.flip()
+                        game.render(renderer)
 
                         if not (game.has_valid_moves(1) or game.has_valid_moves(2)):
                             game_over = True
                             game.display_winner_message(screen)
+                            renderer.invalidate()
                             break  # Ensure winner message shows after last move
 
+        # Let the computer think in the background and move once it is done,
+        # passing when it has no legal move
+        if ai is not None and game.current_player == 2 and not game_over:
+            if not ai.searching:
+                ai.start(engine, game, reversi_ai.AI_TIME)
+            elif ai.poll():
+                # None passes; a pass while White has a move (a failed or
+                # cancelled search) is refused and the search starts over
+                history.play(ai.take_result())
+
         # Check if neither player has valid moves and declare the winner based on chip count
         if not (game.has_valid_moves(1) or game.has_valid_moves(2)) and not game_over:
             game_over = True
             game.display_winner_message(screen)
+            renderer.invalidate()
 
+        stats.end(screen)
         clock.tick(FPS)
 
+    if ai is not None:
+        ai.close()
+    if game.recorder is not None:
+        game.recorder.finish()
+    stats.close()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    profiler.run(main, sys.argv[sys.argv.index("--profile") + 1] if "--profile" in sys.argv else None)
  
\ No newline at end of file
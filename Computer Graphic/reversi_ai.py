@@ -0,0 +1,272 @@
+import time
+
+import reversi_bitboard as bitboard
+import reversi_endgame
+
+# Computer player for Reversi: principal variation search with a
+# transposition table, killer / history move ordering and iterative
+# deepening under a wall-clock budget. It works on a ReversiGame through
+# make_move / make_pass / unmake_move and the incremental Zobrist hash.
+# With ENDGAME_EMPTIES or fewer empty squares left it solves the game
+# exactly with reversi_endgame instead. Given reversi_patterns weights, the
+# leaves are scored by the learned pattern evaluation instead of evaluate().
+
+AI_TIME = 3  # seconds per move
+DISC_SCORE = 10000  # value of one disc of final margin, above any evaluation
+TABLE_SIZE = 1 << 18
+ENDGAME_EMPTIES = 12  # solve exactly from this many empty squares on; 13-14 can take seconds
+ENDGAME_SHARE = 0.5  # part of the time limit the exact solve may take before the search takes over
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def square_weights(size):
+    # Classic positional weights: corners are gold, squares next to them are
+    # poison. Built from the distance to the edges so any board size gets the
+    # same shape; for 8x8 this is the usual table.
+    weights = []
+    for row in range(size):
+        for col in range(size):
+            r, c = min(row, size - 1 - row), min(col, size - 1 - col)
+            r, c = min(r, c), max(r, c)
+            if r == 0 and c == 0:
+                weights.append(100)   # corner
+            elif r == 0 and c == 1:
+                weights.append(-20)   # C-square
+            elif r == 1 and c == 1:
+                weights.append(-50)   # X-square
+            elif r == 0:
+                weights.append(10 if c == 2 else 5)
+            elif r == 1:
+                weights.append(-2)
+            else:
+                weights.append(-1)
+    return weights
+
+
+def weight_masks(weights):
+    # Squares grouped by weight, so the evaluation is a handful of popcounts
+    masks = []
+    for weight in sorted(set(weights)):
+        masks.append((weight, sum(1 << i for i, w in enumerate(weights) if w == weight)))
+    return masks
+
+
+SQUARE_WEIGHTS = square_weights(bitboard.BOARD_SIZE)
+MOBILITY_WEIGHT = 5
+WEIGHT_MASKS = weight_masks(SQUARE_WEIGHTS)
+_size_masks = {bitboard.BOARD_SIZE: WEIGHT_MASKS}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(player_bits, opponent_bits, geo=bitboard.STANDARD):
+    masks = _size_masks.get(geo.size)
+    if masks is None:
+        masks = _size_masks[geo.size] = weight_masks(square_weights(geo.size))
+    score = 0
+    for weight, mask in masks:
+        score += weight * ((player_bits & mask).bit_count() - (opponent_bits & mask).bit_count())
+    mobility = bitboard.get_moves(player_bits, opponent_bits, geo).bit_count()
+    mobility -= bitboard.get_moves(opponent_bits, player_bits, geo).bit_count()
+    return score + MOBILITY_WEIGHT * mobility
+
+
+class ReversiAI:
+    def __init__(self, table_size=TABLE_SIZE, endgame_empties=ENDGAME_EMPTIES, weights=None):
+        self.table_size = table_size
+        self.endgame_empties = endgame_empties
+        self.weights = weights  # reversi_patterns.PatternWeights, 8x8 only
+        self.solver = None
+        self.table = [None] * table_size
+        # Sized for the board by get_move: killers per ply, history per square
+        self.killers = []
+        self.history = []
+        self.infinity = 0  # above any score on the board, also set by get_move
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None
+
+    def order_moves(self, moves, tt_move, ply):
+        # Transposition table move first, then killers, then by history score
+        squares = list(bitboard.iter_bits(moves))
+        squares.sort(key=lambda sq: self.history[sq], reverse=True)
+        for sq in reversed(self.killers[ply]):
+            if sq is not None and sq in squares:
+                squares.remove(sq)
+                squares.insert(0, sq)
+        if tt_move is not None and tt_move in squares:
+            squares.remove(tt_move)
+            squares.insert(0, tt_move)
+        return squares
+
+    def pvs(self, game, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and self.out_of_time():
+            raise SearchTimeout()
+
+        player = game.current_player
+        opponent = 2 if player == 1 else 1
+        player_bits, opponent_bits = game.bitboards[player], game.bitboards[opponent]
+        moves = bitboard.get_moves(player_bits, opponent_bits, game.geometry)
+
+        if not moves:
+            if not bitboard.get_moves(opponent_bits, player_bits, game.geometry):
+                # Game over: score the final disc margin
+                return DISC_SCORE * (player_bits.bit_count() - opponent_bits.bit_count())
+            undo = game.make_pass()
+            score = -self.pvs(game, depth, -beta, -alpha, ply + 1)
+            game.unmake_move(undo)
+            return score
+
+        if depth == 0:
+            if game.patterns is not None:
+                return game.patterns.evaluate(player)
+            return evaluate(player_bits, opponent_bits, game.geometry)
+
+        alpha_orig = alpha
+        slot = game.hash % self.table_size
+        entry = self.table[slot]
+        tt_move = None
+        if entry is not None and entry[0] == game.hash:
+            _, entry_depth, flag, entry_score, tt_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif flag == UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        best_score = -self.infinity
+        best_move = None
+        for i, sq in enumerate(self.order_moves(moves, tt_move, ply)):
+            undo = game.make_move(*divmod(sq, game.size))
+            if i == 0:
+                score = -self.pvs(game, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # Null-window probe, re-searched only if it beats alpha
+                score = -self.pvs(game, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.pvs(game, depth - 1, -beta, -score, ply + 1)
+            game.unmake_move(undo)
+
+            if score > best_score:
+                best_score, best_move = score, sq
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                killers = self.killers[ply]
+                if killers[0] != sq:
+                    killers[1], killers[0] = killers[0], sq
+                self.history[sq] += depth * depth
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[slot] = (game.hash, depth, flag, best_score, best_move)
+        return best_score
+
+    def search_root(self, game, depth):
+        player = game.current_player
+        opponent = 2 if player == 1 else 1
+        moves = bitboard.get_moves(game.bitboards[player], game.bitboards[opponent], game.geometry)
+        entry = self.table[game.hash % self.table_size]
+        tt_move = entry[4] if entry is not None and entry[0] == game.hash else None
+
+        alpha, beta = -self.infinity, self.infinity
+        best_move = None
+        for i, sq in enumerate(self.order_moves(moves, tt_move, 0)):
+            undo = game.make_move(*divmod(sq, game.size))
+            if i == 0:
+                score = -self.pvs(game, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self.pvs(game, depth - 1, -alpha - 1, -alpha, 1)
+                if score > alpha:
+                    score = -self.pvs(game, depth - 1, -beta, -score, 1)
+            game.unmake_move(undo)
+            if score > alpha:
+                alpha, best_move = score, sq
+        self.table[game.hash % self.table_size] = (game.hash, depth, EXACT, alpha, best_move)
+        return alpha, best_move
+
+    def solve_endgame(self, game, time_limit, progress=None):
+        # Exact best move from the endgame solver, or None if it runs out of time
+        if self.solver is None or self.solver.geo is not game.geometry:
+            self.solver = reversi_endgame.EndgameSolver(game.geometry)
+        player = game.current_player
+        try:
+            score, move = self.solver.solve_position(game.bitboards[player], game.bitboards[3 - player],
+                                                     time_limit, self.stop)
+        except reversi_endgame.SearchTimeout:
+            return None
+        finally:
+            self.nodes += self.solver.nodes
+        if progress is not None:
+            empties = game.geometry.squares - (game.bitboards[1] | game.bitboards[2]).bit_count()
+            progress(empties, divmod(move, game.size), DISC_SCORE * score)
+        return divmod(move, game.size)
+
+    def out_of_time(self):
+        return time.perf_counter() > self.deadline or (self.stop is not None and self.stop.is_set())
+
+    def get_move(self, game, time_limit=AI_TIME, progress=None, stop=None, max_depth=None):
+        # Returns the best (row, col) found within `time_limit` seconds, or
+        # None if the current player has to pass.
+        # `progress(depth, move, score)` is called after every finished depth.
+        player = game.current_player
+        moves = bitboard.get_moves(game.bitboards[player], game.bitboards[3 - player], game.geometry)
+        if not moves:
+            return None
+
+        self.nodes = 0
+        self.stop = stop  # anything with is_set(), e.g. a multiprocessing.Event
+        squares = game.geometry.squares
+        self.infinity = DISC_SCORE * (squares + 1)  # a final margin is at most every square
+        self.killers = [[None, None] for _ in range(2 * squares)]  # passes can add plies
+        if len(self.history) != squares:
+            self.history = [0] * squares
+        saved = game.snapshot()
+        best = next(bitboard.iter_bits(moves))
+        empties = squares - (game.bitboards[1] | game.bitboards[2]).bit_count()
+
+        # A fixed-depth search (max_depth) stays heuristic to the end
+        if max_depth is None and empties <= self.endgame_empties:
+            move = self.solve_endgame(game, time_limit * ENDGAME_SHARE, progress)
+            if move is not None:
+                return move
+            time_limit *= 1 - ENDGAME_SHARE  # what the solve left of the budget
+        self.deadline = time.perf_counter() + time_limit
+
+        # The pattern indices follow the search through make_move / unmake_move
+        if self.weights is not None and game.size == self.weights.size:
+            game.patterns = self.weights.tracker(game.bitboards[1], game.bitboards[2])
+        last_depth = empties if max_depth is None else min(empties, max_depth)
+        try:
+            for depth in range(1, last_depth + 1):
+                try:
+                    score, move = self.search_root(game, depth)
+                except SearchTimeout:
+                    # The search was cut off mid-tree; put the board back as it was
+                    game.restore(saved)
+                    break
+                best = move
+                if progress is not None:
+                    progress(depth, divmod(best, game.size), score)
+        finally:
+            game.patterns = None
+        return divmod(best, game.size)
+
+
+def search(game, time_limit=AI_TIME, progress=None, stop=None):
+    # Entry point for SearchScheduler: runs a fresh engine in the worker
+    return ReversiAI().get_move(game, time_limit, progress, stop)
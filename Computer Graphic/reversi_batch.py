@@ -0,0 +1,97 @@
+import numpy as np
+
+import reversi_bitboard as bitboard
+
+# Vectorized Reversi for many positions at once. Boards are stacked into an
+# (N, size, size) array using the same 0 / 1 / 2 encoding as ReversiGame.board,
+# and every direction is handled by shifting the whole stack one square at
+# a time, so each call costs a fixed number of numpy operations whatever N is.
+
+DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (-1, -1), (1, -1), (-1, 1)]
+
+
+def stack(games):
+    # (N, size, size) boards and (N,) side to move from a list of ReversiRules
+    # that all share one board size
+    boards = np.stack([bitboard.to_array(g.bitboards[1], g.bitboards[2], g.size) for g in games])
+    players = np.array([g.current_player for g in games])
+    return boards, players
+
+
+def shift(masks, dr, dc):
+    # Moves every square (r, c) to (r + dr, c + dc); squares pushed off the
+    # board are dropped and the vacated edge is filled with False
+    out = np.zeros_like(masks)
+    size = masks.shape[-1]
+    rows_to = slice(max(dr, 0), size + min(dr, 0))
+    rows_from = slice(max(-dr, 0), size + min(-dr, 0))
+    cols_to = slice(max(dc, 0), size + min(dc, 0))
+    cols_from = slice(max(-dc, 0), size + min(-dc, 0))
+    out[:, rows_to, cols_to] = masks[:, rows_from, cols_from]
+    return out
+
+
+def split(boards, players):
+    # Boolean masks of the mover's and the opponent's discs
+    boards = np.asarray(boards)
+    players = np.broadcast_to(np.asarray(players), boards.shape[:1])[:, None, None]
+    own = boards == players
+    opponent = (boards != 0) & ~own
+    return own, opponent
+
+
+def legal_moves(boards, players):
+    # (N, size, size) mask of legal moves for the side to move on each board
+    own, opponent = split(boards, players)
+    empty = ~(own | opponent)
+    moves = np.zeros_like(own)
+    steps = own.shape[-1] - 2  # longest possible run of opponent discs
+    for dr, dc in DIRECTIONS:
+        run = shift(own, dr, dc) & opponent
+        for _ in range(steps - 1):
+            run |= shift(run, dr, dc) & opponent
+        moves |= shift(run, dr, dc) & empty
+    return moves
+
+
+def flip_masks(boards, players, rows, cols):
+    # (N, size, size) mask of the discs flipped by playing (rows[i], cols[i]) on board i
+    own, opponent = split(boards, players)
+    n = own.shape[0]
+    steps = own.shape[-1] - 2
+    start = np.zeros_like(own)
+    start[np.arange(n), rows, cols] = True
+    start &= ~(own | opponent)
+
+    flips = np.zeros_like(own)
+    for dr, dc in DIRECTIONS:
+        run = shift(start, dr, dc) & opponent
+        for _ in range(steps - 1):
+            run |= shift(run, dr, dc) & opponent
+        closed = (shift(run, dr, dc) & own).any(axis=(1, 2))
+        flips |= run & closed[:, None, None]
+    return flips
+
+
+def apply_moves(boards, players, rows, cols):
+    # New boards after each side to move plays (rows[i], cols[i]).
+    # Illegal moves leave their board unchanged.
+    boards = np.array(boards)
+    players = np.broadcast_to(np.asarray(players), boards.shape[:1])
+    flips = flip_masks(boards, players, rows, cols)
+    legal = flips.any(axis=(1, 2))
+    placed = np.zeros_like(flips)
+    placed[np.arange(len(boards)), rows, cols] = True
+    changed = (flips | placed) & legal[:, None, None]
+    return np.where(changed, players[:, None, None], boards)
+
+
+def disc_counts(boards):
+    # (N, 2) array of black and white disc counts
+    boards = np.asarray(boards)
+    return np.stack([(boards == 1).sum(axis=(1, 2)), (boards == 2).sum(axis=(1, 2))], axis=1)
+
+
+def mobility(boards, players):
+    # (N,) number of legal moves for the side to move
+    return legal_moves(boards, players).sum(axis=(1, 2))
@@ -0,0 +1,201 @@
+import random
+
+import numpy as np
+
+# Bitboard backend for Reversi: one integer per player, bit (row * size + col)
+# is set when that player owns the square. The standard board is 8x8 (64-bit
+# boards); other even sizes such as 10x10 or 16x16 use a Geometry with the
+# matching masks, and every function takes it as an optional last argument.
+
+BOARD_SIZE = 8
+
+
+class Geometry:
+    def __init__(self, size):
+        self.size = size
+        self.squares = size * size
+        self.full = (1 << self.squares) - 1
+
+        # Column masks used to stop shifts from wrapping around the board edges
+        first_column = sum(1 << (row * size) for row in range(size))
+        not_first = self.full & ~first_column
+        not_last = self.full & ~(first_column << (size - 1))
+
+        # (shift, mask applied after the shift) for the 8 directions.
+        # Positive shifts move towards higher indices (east / south).
+        self.shifts = [
+            (1, not_first),          # east
+            (-1, not_last),          # west
+            (size, self.full),       # south
+            (-size, self.full),      # north
+            (size + 1, not_first),   # south-east
+            (-size - 1, not_last),   # north-west
+            (size - 1, not_last),    # south-west
+            (-size + 1, not_first),  # north-east
+        ]
+
+        # The same directions with the shifts of a doubling fill: distances
+        # 1, 2, 4, ... squares, enough to cover the longest possible run
+        steps = []
+        step = 1
+        while step < size - 1:
+            steps.append(step)
+            step *= 2
+        self.fills = [(amount, mask, [abs(amount) * step for step in steps]) for amount, mask in self.shifts]
+
+        # Zobrist keys: one random 64-bit number per (player, square), plus one
+        # for White to move. A fixed seed keeps hashes stable between runs.
+        rng = random.Random(0x5EED if size == BOARD_SIZE else 0x5EED + size)
+        self.zobrist = [[0] * self.squares] + [[rng.getrandbits(64) for _ in range(self.squares)] for _ in range(2)]
+        self.zobrist_side = rng.getrandbits(64)
+
+
+_geometries = {}
+
+
+def geometry(size):
+    if size % 2 or size < 4:
+        raise ValueError(f"Reversi needs an even board size of at least 4, got {size}")
+    if size not in _geometries:
+        _geometries[size] = Geometry(size)
+    return _geometries[size]
+
+
+STANDARD = geometry(BOARD_SIZE)
+FULL = STANDARD.full
+SHIFTS = STANDARD.shifts
+ZOBRIST = STANDARD.zobrist
+ZOBRIST_SIDE = STANDARD.zobrist_side
+
+
+def square_bit(row, col, size=BOARD_SIZE):
+    return 1 << (row * size + col)
+
+
+def shift(bits, amount, mask):
+    if amount > 0:
+        return (bits << amount) & mask
+    return (bits >> -amount) & mask
+
+
+def get_moves(player, opponent, geo=STANDARD):
+    # Returns a bitboard of every legal move for `player`.
+    # For each direction, runs of opponent discs next to the player's discs
+    # are filled with a doubling (Kogge-Stone) fill, so a direction costs
+    # O(log size) shifts; a run ending on an empty square is a move.
+    empty = geo.full & ~(player | opponent)
+    moves = 0
+    for amount, mask, fill in geo.fills:
+        targets = opponent & mask
+        if amount > 0:
+            gen = (player << amount) & targets
+            prop = targets
+            for step in fill:
+                gen |= prop & (gen << step)
+                prop &= prop << step
+            moves |= (gen << amount) & mask & empty
+        else:
+            amount = -amount
+            gen = (player >> amount) & targets
+            prop = targets
+            for step in fill:
+                gen |= prop & (gen >> step)
+                prop &= prop >> step
+            moves |= (gen >> amount) & mask & empty
+    return moves
+
+
+def has_moves(player, opponent, geo=STANDARD):
+    # Same fills as get_moves, but stops at the first direction with a move
+    empty = geo.full & ~(player | opponent)
+    for amount, mask, fill in geo.fills:
+        targets = opponent & mask
+        if amount > 0:
+            gen = (player << amount) & targets
+            prop = targets
+            for step in fill:
+                gen |= prop & (gen << step)
+                prop &= prop << step
+            if (gen << amount) & mask & empty:
+                return True
+        else:
+            amount = -amount
+            gen = (player >> amount) & targets
+            prop = targets
+            for step in fill:
+                gen |= prop & (gen >> step)
+                prop &= prop >> step
+            if (gen >> amount) & mask & empty:
+                return True
+    return False
+
+
+def get_flips(player, opponent, move_bit, geo=STANDARD):
+    # Returns the bitboard of opponent discs flipped by playing `move_bit`
+    if (player | opponent) & move_bit:
+        return 0
+    flips = 0
+    for amount, mask in geo.shifts:
+        line = 0
+        x = shift(move_bit, amount, mask)
+        while x & opponent:
+            line |= x
+            x = shift(x, amount, mask)
+        if x & player:
+            flips |= line
+    return flips
+
+
+def iter_bits(bits):
+    # Yields the index of each set bit, lowest first
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def to_squares(bits, size=BOARD_SIZE):
+    return [divmod(index, size) for index in iter_bits(bits)]
+
+
+def count(bits):
+    return bits.bit_count()
+
+
+def _unpack(bits, squares):
+    data = np.frombuffer(bits.to_bytes((squares + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(data, bitorder="little")[:squares]
+
+
+def to_array(black, white, size=BOARD_SIZE):
+    # Builds the 0 / 1 / 2 numpy board used by the drawing code
+    squares = size * size
+    board = _unpack(black, squares).astype(int) + 2 * _unpack(white, squares).astype(int)
+    return board.reshape(size, size)
+
+
+def from_array(board):
+    board = np.asarray(board).reshape(-1)
+    weights = [1 << i for i in range(len(board))]
+    black = sum(w for w, v in zip(weights, board) if v == 1)
+    white = sum(w for w, v in zip(weights, board) if v == 2)
+    return black, white
+
+
+def zobrist_hash(black, white, player, geo=STANDARD):
+    # Full hash of a position, used once at setup; moves update it incrementally
+    h = geo.zobrist_side if player == 2 else 0
+    for index in iter_bits(black):
+        h ^= geo.zobrist[1][index]
+    for index in iter_bits(white):
+        h ^= geo.zobrist[2][index]
+    return h
+
+
+def zobrist_move(player, move_index, flips, geo=STANDARD):
+    # Hash change for `player` playing `move_index` and flipping `flips`
+    mine, theirs = geo.zobrist[player], geo.zobrist[3 - player]
+    h = mine[move_index] ^ geo.zobrist_side
+    for index in iter_bits(flips):
+        h ^= mine[index] ^ theirs[index]
+    return h
@@ -0,0 +1,416 @@
+import argparse
+import time
+
+import reversi_bitboard as bitboard
+
+# Exact endgame solver for Reversi. With few empty squares left the game
+# tree is small enough to search to the end, so instead of the heuristic
+# evaluation this returns the exact final disc margin for the side to move.
+# Scores count discs only, as ReversiRules.get_winner does: squares left
+# empty when neither player can move go to nobody.
+#
+# Speed comes from specializing the search by the number of empties:
+#   many empties   transposition table, fastest-first ordering (moves that
+#                  leave the opponent the fewest replies first), region
+#                  parity as the tie-break and stable-disc cutoffs
+#   few empties    parity ordering only
+#   last empties   solve_small: no move generator, no ordering, just a flip
+#                  test on each empty square
+#
+#   python reversi_endgame.py                     solve the test suite
+#   python reversi_endgame.py --max-empties 14     skip the slower positions
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+SMALL_EMPTIES = 6  # at or below this, solve_small
+FASTEST_FIRST_EMPTIES = 7  # at or above this, fastest-first ordering
+TABLE_EMPTIES = 8  # at or above this, use the transposition table
+STABILITY_EMPTIES = 8  # at or above this, try stable-disc cutoffs
+TABLE_LIMIT = 1 << 20  # entries kept before the table is cleared
+CHECK_NODES = 4096  # nodes between looks at the clock
+
+# Test positions from seeded random games with 10 to 18 empties: 64
+# characters row by row (X black, O white, - empty), the side to move and the
+# exact margin for that side. --verify recomputes the margins with plain
+# minimax, which is only practical up to about 11 empties.
+SUITE = [
+    ("XOOOO--OXXO-OOOOXOXOOOO-XXOOOOOOOXOOXXO-OOXOOXO-OOOXXOO--O-XXOO-", "X", 36),
+    ("O-XOX-X-XXXXOX--XOXOXO--XXOXOOOOXXXOXOXOXXOOOOX-XXX-OOXXXXXXXO--", "O", -4),
+    ("OXO--O--XXO-OO-XXXXOOOO-OOOOOXOO-OOOOXO-X-OOOOXO-OXOOOOOO-OOOOOO", "X", -16),
+    ("-XXXXXX-OOOXOOOX-OOOXOOOOXOOXX-OX-XOOXXXXOOXXOXXOO-OX-X----OXX-O", "X", 8),
+    ("---OO----OOOOOXXXXXOXXXXO-OXOOXX-OXOOXXXXXXXXXOOXO--O-OXO-OOOOOX", "O", -6),
+    ("-O-XOOO-XOXO-OOX-OOXOOOXOOXXOOOOOO-OXOOOOOOXOOX--O-XXXX----OXXX-", "X", 22),
+    ("-XOOOOOOOOOOOX--OXXOXOX-OXOXOOO-OXOOOOOOOX-XXXOOOXXXXX-O-----X--", "X", 2),
+    ("XO-O-----XXXOOO-XXX-X---XXOXOXX-XOXXOOXOXOOXOOOXXOOOOOO-XOX-O-OO", "O", -10),
+    ("-----XO-XO--XOXXX-OXOXXXXOXOXXXXOOOXOOXX-OXO-OXXOXOOO-XX-O-O-X-X", "X", 48),
+    ("--OX----X-OXO---XXXXXXX-XXOXOX-OXOOOXXXOXOXXOXXO-OXXXX--OOXXXXX-", "X", -46),
+    ("-X---X----X-XXXXXXXXXXXX--OXOXOOOOOOXOOXXOOXOXOX-XOOOOO---XO-XO-", "O", 24),
+    ("--O---X----OOOOO-X--XOOOOXXOOOOO-XOOOXOOXXOOOOOOOO-OOOO-O-OOOO--", "X", 12),
+]
+
+
+def parse_position(text, side):
+    # Returns (player bits, opponent bits) for the side to move
+    black = white = 0
+    for index, char in enumerate(text):
+        if char == "X":
+            black |= 1 << index
+        elif char == "O":
+            white |= 1 << index
+    return (black, white) if side == "X" else (white, black)
+
+
+class Tables:
+    # Per-geometry masks for parity regions and stability
+    def __init__(self, geo):
+        size, half = geo.size, geo.size // 2
+        # Region (quadrant) bit of every square, for parity
+        self.region = [1 << ((row >= half) * 2 + (col >= half)) for row in range(size) for col in range(size)]
+        self.region_masks = [sum(1 << sq for sq in range(geo.squares) if self.region[sq] == 1 << r) for r in range(4)]
+        # Squares in odd regions for each parity value
+        self.odd_masks = [sum(mask for r, mask in enumerate(self.region_masks) if parity & (1 << r)) for parity in range(16)]
+
+        # For each of the 4 axes: the shifts that look at the neighbour on
+        # either side, the squares without such a neighbour (board edges)
+        # and the lines along the axis
+        self.axes = []
+        for first in range(0, 8, 2):
+            forward, backward = geo.shifts[first], geo.shifts[first + 1]
+            no_forward = sum(1 << sq for sq in range(geo.squares) if not bitboard.shift(1 << sq, *forward))
+            no_backward = sum(1 << sq for sq in range(geo.squares) if not bitboard.shift(1 << sq, *backward))
+            lines = []
+            for sq in bitboard.iter_bits(no_backward):
+                line = bit = 1 << sq
+                while True:
+                    bit = bitboard.shift(bit, *forward)
+                    if not bit:
+                        break
+                    line |= bit
+                lines.append(line)
+            # Squares whose forward neighbour is in a set: shift the set backward
+            self.axes.append((backward, forward, no_forward | no_backward, lines))
+
+        # For every square, the squares in each direction nearest first, for
+        # rays of at least two squares (one to flip and one to anchor)
+        self.rays = []
+        for sq in range(geo.squares):
+            rays = []
+            for amount, mask in geo.shifts:
+                ray = []
+                bit = bitboard.shift(1 << sq, amount, mask)
+                while bit:
+                    ray.append(bit)
+                    bit = bitboard.shift(bit, amount, mask)
+                if len(ray) >= 2:
+                    rays.append(ray)
+            self.rays.append(rays)
+
+    def stable(self, discs, occupied):
+        # Discs that can never be flipped: along each axis the line is full,
+        # or a neighbour is the board edge or another stable disc of the same
+        # color. Grown from the edges until nothing changes.
+        axes = []
+        for backward, forward, edges, lines in self.axes:
+            full = 0
+            for line in lines:
+                if occupied & line == line:
+                    full |= line
+            axes.append((backward, forward, edges | full))
+        stable = 0
+        while True:
+            grown = discs
+            for backward, forward, safe in axes:
+                grown &= safe | bitboard.shift(stable, *backward) | bitboard.shift(stable, *forward)
+            if grown == stable:
+                return stable
+            stable = grown
+
+
+def ray_flips(rays, player, opponent):
+    # Discs flipped by `player` on the square with these rays (which must be
+    # empty). Walks the precomputed rays instead of shifting whole boards,
+    # which is quicker with only a few discs to look at.
+    flips = 0
+    for ray in rays:
+        line = 0
+        for bit in ray:
+            if opponent & bit:
+                line |= bit
+            else:
+                if player & bit:
+                    flips |= line
+                break
+    return flips
+
+
+_tables = {}
+
+
+def tables(geo):
+    if geo.size not in _tables:
+        _tables[geo.size] = Tables(geo)
+    return _tables[geo.size]
+
+
+class EndgameSolver:
+    def __init__(self, geo=bitboard.STANDARD):
+        self.geo = geo
+        self.full = geo.full
+        self.squares = geo.squares
+        self.tables = tables(geo)
+        self.table = {}
+        self.nodes = 0
+        self.next_check = CHECK_NODES
+        self.deadline = None
+        self.stop = None
+
+    def out_of_time(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return True
+        return self.stop is not None and self.stop.is_set()
+
+    def parity(self, empty):
+        # Bit set for each region with an odd number of empty squares
+        parity = 0
+        for r, mask in enumerate(self.tables.region_masks):
+            if (empty & mask).bit_count() & 1:
+                parity |= 1 << r
+        return parity
+
+    def stability_cutoff(self, player, opponent, alpha, beta):
+        # The margin is at most squares - 2 * (opponent's stable discs) and at
+        # least 2 * (own stable discs) - squares. The disc counts bound the
+        # stable counts, so the stable discs are only worked out when a
+        # cutoff is possible at all. Returns a score to cut with, or None.
+        occupied = player | opponent
+        if alpha >= self.squares - 2 * opponent.bit_count():
+            bound = self.squares - 2 * self.tables.stable(opponent, occupied).bit_count()
+            if bound <= alpha:
+                return bound
+        if beta <= 2 * player.bit_count() - self.squares:
+            bound = 2 * self.tables.stable(player, occupied).bit_count() - self.squares
+            if bound >= beta:
+                return bound
+        return None
+
+    def solve(self, player, opponent, alpha, beta, parity):
+        # Exact disc margin for the side to move, searched with (alpha, beta)
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            # The small solver counts nodes too, so look at the clock once
+            # CHECK_NODES have passed rather than on exact multiples
+            self.next_check = self.nodes + CHECK_NODES
+            if self.out_of_time():
+                raise SearchTimeout()
+        geo = self.geo
+        empty = self.full & ~(player | opponent)
+        empties = empty.bit_count()
+        if empties <= SMALL_EMPTIES:
+            return self.solve_small(player, opponent, alpha, beta, empty, parity)
+
+        if empties >= STABILITY_EMPTIES:
+            cut = self.stability_cutoff(player, opponent, alpha, beta)
+            if cut is not None:
+                return cut
+
+        moves = bitboard.get_moves(player, opponent, geo)
+        if not moves:
+            if not bitboard.has_moves(opponent, player, geo):
+                return player.bit_count() - opponent.bit_count()
+            return -self.solve(opponent, player, -beta, -alpha, parity)
+
+        key = None
+        table_move = None
+        if empties >= TABLE_EMPTIES:
+            key = (player, opponent)
+            entry = self.table.get(key)
+            if entry is not None:
+                lower, upper, table_move = entry
+                if lower >= beta:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                alpha, beta = max(alpha, lower), min(beta, upper)
+
+        rays, region = self.tables.rays, self.tables.region
+        children = []
+        for sq in bitboard.iter_bits(moves):
+            bit = 1 << sq
+            flips = ray_flips(rays[sq], player, opponent)
+            mine, theirs = player | bit | flips, opponent & ~flips
+            if sq == table_move:
+                order = -1
+            elif empties >= FASTEST_FIRST_EMPTIES:
+                # Fastest first: fewest opponent replies, odd regions breaking ties
+                order = 2 * bitboard.get_moves(theirs, mine, geo).bit_count() + (not (parity & region[sq]))
+            else:
+                order = not (parity & region[sq])
+            children.append((order, sq, mine, theirs))
+        children.sort()
+
+        alpha_orig = alpha
+        best_score, best_move = -self.squares - 1, None
+        for i, (_, sq, mine, theirs) in enumerate(children):
+            child_parity = parity ^ region[sq]
+            if i == 0:
+                score = -self.solve(theirs, mine, -beta, -alpha, child_parity)
+            else:
+                # Null-window probe, re-searched only if it beats alpha
+                score = -self.solve(theirs, mine, -alpha - 1, -alpha, child_parity)
+                if alpha < score < beta:
+                    score = -self.solve(theirs, mine, -beta, -score, child_parity)
+            if score > best_score:
+                best_score, best_move = score, sq
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if key is not None:
+            if len(self.table) >= TABLE_LIMIT:
+                self.table.clear()
+            lower, upper = -self.squares, self.squares
+            if best_score > alpha_orig:
+                lower = best_score
+            if best_score < beta:
+                upper = best_score
+            self.table[key] = (lower, upper, best_move)
+        return best_score
+
+    def solve_small(self, player, opponent, alpha, beta, empty, parity):
+        # The last few empties: tries each empty square directly, squares in
+        # odd regions first, without generating a move bitboard
+        self.nodes += 1
+        if empty & (empty - 1) == 0:
+            if not empty:
+                return player.bit_count() - opponent.bit_count()
+            return self.solve_last(player, opponent, empty.bit_length() - 1)
+
+        rays, region = self.tables.rays, self.tables.region
+        odd = self.tables.odd_masks[parity]
+        best_score = None
+        for squares in (empty & odd, empty & ~odd):
+            for sq in bitboard.iter_bits(squares):
+                flips = ray_flips(rays[sq], player, opponent)
+                if not flips:
+                    continue
+                bit = 1 << sq
+                score = -self.solve_small(opponent & ~flips, player | bit | flips, -beta, -alpha,
+                                          empty ^ bit, parity ^ region[sq])
+                if best_score is None or score > best_score:
+                    best_score = score
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            return best_score
+        if best_score is not None:
+            return best_score
+
+        # No move: pass if the opponent has one, otherwise the game is over
+        for sq in bitboard.iter_bits(empty):
+            if ray_flips(rays[sq], opponent, player):
+                return -self.solve_small(opponent, player, -beta, -alpha, empty, parity)
+        return player.bit_count() - opponent.bit_count()
+
+    def solve_last(self, player, opponent, sq):
+        # One empty square: whoever can play there does, the player first
+        self.nodes += 1
+        rays = self.tables.rays[sq]
+        margin = player.bit_count() - opponent.bit_count()
+        flips = ray_flips(rays, player, opponent).bit_count()
+        if flips:
+            return margin + 1 + 2 * flips
+        flips = ray_flips(rays, opponent, player).bit_count()
+        if flips:
+            return margin - 1 - 2 * flips
+        return margin
+
+    def solve_position(self, player, opponent, time_limit=None, stop=None):
+        # Returns (exact margin, best square or None when passing) for the
+        # side to move. Raises SearchTimeout past `time_limit` seconds or
+        # once stop.is_set().
+        self.nodes = 0
+        self.next_check = CHECK_NODES
+        self.table.clear()
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.stop = stop
+        empty = self.full & ~(player | opponent)
+        parity = self.parity(empty)
+        moves = bitboard.get_moves(player, opponent, self.geo)
+        if not moves:
+            return self.solve(player, opponent, -self.squares, self.squares, parity), None
+
+        alpha, beta = -self.squares - 1, self.squares + 1
+        best_move = None
+        children = []
+        for sq in bitboard.iter_bits(moves):
+            bit = 1 << sq
+            flips = bitboard.get_flips(player, opponent, bit, self.geo)
+            mine, theirs = player | bit | flips, opponent & ~flips
+            children.append((bitboard.get_moves(theirs, mine, self.geo).bit_count(), sq, mine, theirs))
+        children.sort()
+        for i, (_, sq, mine, theirs) in enumerate(children):
+            child_parity = parity ^ self.tables.region[sq]
+            if i == 0:
+                score = -self.solve(theirs, mine, -beta, -alpha, child_parity)
+            else:
+                score = -self.solve(theirs, mine, -alpha - 1, -alpha, child_parity)
+                if score > alpha:
+                    score = -self.solve(theirs, mine, -beta, -score, child_parity)
+            if score > alpha:
+                alpha, best_move = score, sq
+        return alpha, best_move
+
+
+def minimax(player, opponent, geo=bitboard.STANDARD):
+    # Plain full-width search, the reference for --verify
+    moves = bitboard.get_moves(player, opponent, geo)
+    if not moves:
+        if not bitboard.get_moves(opponent, player, geo):
+            return player.bit_count() - opponent.bit_count()
+        return -minimax(opponent, player, geo)
+    best = -geo.squares
+    for sq in bitboard.iter_bits(moves):
+        bit = 1 << sq
+        flips = bitboard.get_flips(player, opponent, bit, geo)
+        best = max(best, -minimax(opponent & ~flips, player | bit | flips, geo))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve the Reversi endgame test suite exactly")
+    parser.add_argument("--max-empties", type=int, default=64, help="skip positions with more empty squares")
+    parser.add_argument("--verify", action="store_true", help="check the scores with plain minimax (slow)")
+    args = parser.parse_args()
+
+    solver = EndgameSolver()
+    total_nodes = total_time = 0
+    failed = False
+    for number, (text, side, expected) in enumerate(SUITE, 1):
+        player, opponent = parse_position(text, side)
+        empties = text.count("-")
+        if empties > args.max_empties:
+            continue
+        start = time.perf_counter()
+        score, move = solver.solve_position(player, opponent)
+        seconds = time.perf_counter() - start
+        total_nodes += solver.nodes
+        total_time += seconds
+        if args.verify:
+            expected = minimax(player, opponent)
+        status = "ok" if score == expected else f"MISMATCH, expected {expected:+}"
+        failed |= score != expected
+        square = "pass" if move is None else "abcdefgh"[move % 8] + str(move // 8 + 1)
+        print(f"#{number:2} {empties:2} empties  {side} {square:4} {score:+3}  {solver.nodes:10,} nodes "
+              f"{seconds:7.2f}s {solver.nodes / seconds:9,.0f} nodes/s  {status}")
+    if total_time:
+        print(f"total {total_nodes:,} nodes in {total_time:.2f}s ({total_nodes / total_time:,.0f} nodes/s)")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
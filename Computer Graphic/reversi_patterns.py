@@ -0,0 +1,288 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+import reversi_bitboard as bitboard
+from game_records import REVERSI, UNFINISHED, read_records, replay
+from reversi_ai import ReversiAI, AI_TIME
+from reversi_rules import ReversiRules
+
+# Learned evaluation for 8x8 Reversi: the value of a position is the sum of
+# weights looked up for the contents of a set of square patterns (edges,
+# corners, rows, diagonals), each seen in all its rotations and reflections.
+# A pattern of n squares reads as an n-digit base-3 number (0 empty, 1 black,
+# 2 white), which indexes one weight table per pattern; the tables are
+# flattened into one array per game phase. The value is the final disc
+# margin predicted for Black.
+#
+# PatternTracker keeps the pattern indices of a game up to date on every
+# make_move / unmake_move, so an evaluation is one phase lookup and a sum
+# over the instances.
+#
+# File layout (little endian):
+#   header   magic b"RPAT", version, phases, entries per phase
+#   weights  phases x entries float32
+#
+# The file is memory-mapped and the table is a numpy view over it, so
+# loading copies nothing. Train on self-play records:
+#
+#   python selfplay.py reversi --games 20000 --agents search:2 greedy --alternate --out - --record games.rec > /dev/null
+#   python reversi_patterns.py train games.rec --epochs 30
+#   python reversi.py --ai --patterns
+
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reversi_patterns.bin")
+MAGIC = b"RPAT"
+VERSION = 1
+HEADER = struct.Struct("<4sBBI")
+
+SIZE = 8
+PHASES = 6
+PHASE_PLIES = 10  # discs placed per phase
+EVAL_SCALE = 100  # evaluation units per disc of predicted margin, below reversi_ai.DISC_SCORE
+EPOCHS = 30
+REGULARIZATION = 2.0  # pulls weights seen in few positions towards zero
+VALIDATION = 10  # every VALIDATION-th game is held out to measure the fit
+
+# (name, squares as (row, col)) in their base orientation
+PATTERNS = [
+    ("edge+2x", [(0, col) for col in range(8)] + [(1, 1), (1, 6)]),
+    ("corner3x3", [(row, col) for row in range(3) for col in range(3)]),
+    ("corner2x5", [(row, col) for row in range(2) for col in range(5)]),
+    ("row2", [(1, col) for col in range(8)]),
+    ("row3", [(2, col) for col in range(8)]),
+    ("row4", [(3, col) for col in range(8)]),
+    ("diag8", [(i, i) for i in range(8)]),
+    ("diag7", [(i, i + 1) for i in range(7)]),
+    ("diag6", [(i, i + 2) for i in range(6)]),
+    ("diag5", [(i, i + 3) for i in range(5)]),
+    ("diag4", [(i, i + 4) for i in range(4)]),
+]
+
+
+def symmetries(row, col):
+    # The 8 images of a square under rotation and reflection
+    n = SIZE - 1
+    return [(row, col), (col, row), (row, n - col), (n - row, col),
+            (n - row, n - col), (n - col, n - row), (col, n - row), (n - col, row)]
+
+
+def build_instances():
+    # Every distinct placement of every pattern. Returns the matrix of digit
+    # values (square x instance), the table offset of each instance and the
+    # number of entries in a phase.
+    powers = []
+    offsets = []
+    entries = 0
+    for name, squares in PATTERNS:
+        seen = set()
+        for t in range(8):
+            image = tuple(symmetries(row, col)[t] for row, col in squares)
+            if image in seen:
+                continue
+            seen.add(image)
+            column = [0] * (SIZE * SIZE)
+            for digit, (row, col) in enumerate(image):
+                column[row * SIZE + col] = 3 ** digit
+            powers.append(column)
+            offsets.append(entries)
+        entries += 3 ** len(squares)
+    return np.array(powers, dtype=np.int64).T, np.array(offsets, dtype=np.int64), entries
+
+
+POWERS, OFFSETS, ENTRIES = build_instances()
+SQUARE_POWERS = list(POWERS)  # per square, the index change of one digit step in every instance
+START = ReversiRules(SIZE).bitboards[1:]
+
+
+def unpack(bits):
+    # 0/1 array of the 64 squares of a bitboard
+    return np.unpackbits(np.frombuffer(bits.to_bytes(8, "little"), dtype=np.uint8), bitorder="little")
+
+
+def pattern_indices(black, white):
+    # Index into the phase table for every instance, from scratch
+    return (unpack(black) + 2 * unpack(white).astype(np.int64)) @ POWERS + OFFSETS
+
+
+def batch_indices(black, white, chunk=20000):
+    # The same for arrays of bitboards, (positions x instances) int32
+    result = np.empty((len(black), len(OFFSETS)), dtype=np.int32)
+    squares = np.arange(SIZE * SIZE, dtype=np.uint64)
+    for start in range(0, len(black), chunk):
+        b = black[start:start + chunk, None]
+        w = white[start:start + chunk, None]
+        digits = ((b >> squares) & 1) + 2 * ((w >> squares) & 1)
+        result[start:start + chunk] = digits.astype(np.float64) @ POWERS + OFFSETS
+    return result
+
+
+def phase(discs):
+    return min(PHASES - 1, (discs - 4) // PHASE_PLIES)
+
+
+class PatternWeights:
+    def __init__(self, table, mapping=None):
+        self.table = table  # (PHASES, ENTRIES) float32
+        self.mapping = mapping
+        self.size = SIZE
+
+    def tracker(self, black, white):
+        return PatternTracker(self, black, white)
+
+    def evaluate(self, black, white, player):
+        # Evaluation from scratch for the side `player`, in search units
+        value = self.table[phase((black | white).bit_count())][pattern_indices(black, white)].sum()
+        return int(value * EVAL_SCALE) if player == 1 else -int(value * EVAL_SCALE)
+
+    def save(self, path=WEIGHTS_PATH):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, PHASES, ENTRIES))
+            f.write(self.table.astype("<f4").tobytes())
+
+
+def load_weights(path=WEIGHTS_PATH):
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, phases, entries = HEADER.unpack_from(mapping)
+    if magic != MAGIC or version != VERSION or phases != PHASES or entries != ENTRIES:
+        mapping.close()
+        raise ValueError(f"{path} is not a version {VERSION} weights file for these patterns")
+    table = np.frombuffer(mapping, dtype="<f4", count=phases * entries, offset=HEADER.size)
+    return PatternWeights(table.reshape(phases, entries), mapping)
+
+
+_weights = None
+
+
+def weights():
+    # The default weights file, loaded once per process
+    global _weights
+    if _weights is None:
+        _weights = load_weights()
+    return _weights
+
+
+class PatternTracker:
+    # Pattern indices of one game, updated by ReversiRules.make_move and
+    # unmake_move while attached as `game.patterns`
+    def __init__(self, weights, black, white):
+        self.table = weights.table
+        self.reset(black, white)
+
+    def reset(self, black, white):
+        # Starts over from a position set without make_move (restore, board)
+        self.indices = pattern_indices(black, white)
+        self.discs = (black | white).bit_count()
+        self.stack = []
+
+    def move(self, player, move_index, flips):
+        # The new disc adds its digit; a flipped disc goes from the
+        # opponent's digit to the player's, -1 for Black and +1 for White.
+        # A handful of row additions beats unpacking the flips for a product.
+        self.stack.append(self.indices)
+        indices = self.indices + player * SQUARE_POWERS[move_index]
+        if player == 1:
+            for sq in bitboard.iter_bits(flips):
+                indices -= SQUARE_POWERS[sq]
+        else:
+            for sq in bitboard.iter_bits(flips):
+                indices += SQUARE_POWERS[sq]
+        self.indices = indices
+        self.discs += 1
+
+    def undo(self):
+        self.indices = self.stack.pop()
+        self.discs -= 1
+
+    def evaluate(self, player):
+        value = self.table[phase(self.discs)][self.indices].sum()
+        return int(value * EVAL_SCALE) if player == 1 else -int(value * EVAL_SCALE)
+
+
+def search(game, time_limit=AI_TIME, progress=None, stop=None):
+    # Entry point for SearchScheduler: reversi_ai's search on the learned evaluation
+    return ReversiAI(weights=weights()).get_move(game, time_limit, progress, stop)
+
+
+def training_positions(records):
+    # Yields (black, white, final margin for Black, game number) for every
+    # position before the end of each finished 8x8 Reversi game
+    for number, record in enumerate(records):
+        if record.variant != REVERSI or record.rows != SIZE or record.result == UNFINISHED:
+            continue
+        boards = [tuple(START)]
+        for game in replay(record):
+            boards.append((game.bitboards[1], game.bitboards[2]))
+        black, white = boards.pop()
+        margin = black.bit_count() - white.bit_count()
+        for b, w in boards:
+            yield b, w, margin, number
+
+
+def fit(indices, targets, entries, epochs=EPOCHS, regularization=REGULARIZATION, report=None):
+    # Least squares for sum(weights[indices[i]]) ~ targets[i], solved with
+    # vectorized Jacobi steps: every weight moves by the mean residual of the
+    # positions it appears in, shared out over the instances
+    weights = np.zeros(entries)
+    flat = indices.ravel()
+    instances = indices.shape[1]
+    step = 1.0 / (instances * (np.bincount(flat, minlength=entries) + regularization))
+    for epoch in range(epochs):
+        residual = targets - weights[indices].sum(axis=1)
+        weights += step * np.bincount(flat, weights=np.repeat(residual, instances), minlength=entries)
+        if report is not None:
+            report(epoch, weights)
+    return weights
+
+
+def train(paths, epochs=EPOCHS, regularization=REGULARIZATION, out=WEIGHTS_PATH):
+    start = time.perf_counter()
+    rows = [row for path in paths for row in training_positions(read_records(path, use_mmap=True))]
+    if not rows:
+        raise ValueError("no finished 8x8 Reversi games in the archives")
+    black = np.array([row[0] for row in rows], dtype=np.uint64)
+    white = np.array([row[1] for row in rows], dtype=np.uint64)
+    targets = np.array([row[2] for row in rows], dtype=np.float64)
+    held_out = np.array([row[3] % VALIDATION == 0 for row in rows])
+    discs = np.array([(row[0] | row[1]).bit_count() for row in rows])
+    indices = batch_indices(black, white)
+    print(f"{len(rows):,} positions from {len(set(row[3] for row in rows)):,} games "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    table = np.zeros((PHASES, ENTRIES), dtype=np.float32)
+    phases = np.minimum(PHASES - 1, (discs - 4) // PHASE_PLIES)
+    for p in range(PHASES):
+        train_rows = (phases == p) & ~held_out
+        test_rows = (phases == p) & held_out
+        if not train_rows.any():
+            continue
+        weights = fit(indices[train_rows], targets[train_rows], ENTRIES, epochs, regularization)
+        table[p] = weights
+        train_error = np.abs(targets[train_rows] - weights[indices[train_rows]].sum(axis=1)).mean()
+        line = f"phase {p}: {train_rows.sum():9,} positions, mean error {train_error:5.2f} discs"
+        if test_rows.any():
+            test_error = np.abs(targets[test_rows] - weights[indices[test_rows]].sum(axis=1)).mean()
+            baseline = np.abs(targets[test_rows] - targets[train_rows].mean()).mean()
+            line += f", held out {test_error:5.2f} (constant guess {baseline:5.2f})"
+        print(line)
+    PatternWeights(table).save(out)
+    print(f"wrote {out} in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Reversi pattern evaluation on game records")
+    parser.add_argument("command", choices=("train",))
+    parser.add_argument("archives", nargs="+", help="game record archives (game_records.py)")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--regularization", type=float, default=REGULARIZATION)
+    parser.add_argument("--out", default=WEIGHTS_PATH)
+    args = parser.parse_args()
+    train(args.archives, args.epochs, args.regularization, args.out)
+
+
+if __name__ == "__main__":
+    main()
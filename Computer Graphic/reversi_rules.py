@@ -0,0 +1,176 @@
+import reversi_bitboard as bitboard
+
+# Reversi rules without any drawing, so they can be imported headless
+# (self-play, benchmarks, servers). reversi.py adds the pygame front end.
+
+BOARD_SIZE = bitboard.BOARD_SIZE
+
+
+class ReversiRules:
+    def __init__(self, size=BOARD_SIZE):
+        # The board is kept as two bitboards, indexed by player: 1 for black, 2 for white
+        self.size = size
+        self.geometry = bitboard.geometry(size)
+        self.bitboards = [0, 0, 0]
+        self.current_player = 1
+
+        # Legal moves are cached per player and tagged with the board version,
+        # which goes up on every change to the discs
+        self.version = 0
+        self.move_cache = [None, None, None]  # [version, move bitboard, squares or None]
+        self.any_move_cache = [None, None, None]  # (version, has a move)
+        self.recorder = None  # game_records.GameRecorder fed by place_tile and play
+        self.patterns = None  # reversi_patterns.PatternTracker fed by make_move / unmake_move
+
+        # Initial setup: four discs in the middle of the board
+        low, high = size // 2 - 1, size // 2
+        self.bitboards[2] = bitboard.square_bit(low, low, size) | bitboard.square_bit(high, high, size)  # White tiles
+        self.bitboards[1] = bitboard.square_bit(low, high, size) | bitboard.square_bit(high, low, size)  # Black tiles
+        self.hash = bitboard.zobrist_hash(self.bitboards[1], self.bitboards[2], self.current_player, self.geometry)
+
+    @property
+    def board(self):
+        # 0 for empty, 1 for black, 2 for white. A snapshot of the bitboards,
+        # so it is read-only: game.board[r][c] = x raises instead of doing
+        # nothing. Set the whole board through the setter.
+        board = bitboard.to_array(self.bitboards[1], self.bitboards[2], self.size)
+        board.flags.writeable = False
+        return board
+
+    @board.setter
+    def board(self, value):
+        self.bitboards[1], self.bitboards[2] = bitboard.from_array(value)
+        self.version += 1
+        self.hash = bitboard.zobrist_hash(self.bitboards[1], self.bitboards[2], self.current_player, self.geometry)
+        if self.patterns is not None:
+            self.patterns.reset(self.bitboards[1], self.bitboards[2])
+
+    def is_valid_move(self, row, col, player):
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            return False
+        opponent = 2 if player == 1 else 1
+        flips = bitboard.get_flips(self.bitboards[player], self.bitboards[opponent],
+                                   bitboard.square_bit(row, col, self.size), self.geometry)
+        return flips != 0
+
+    def valid_move_bits(self, player):
+        # Bitboard of the player's legal moves, generated once per board version
+        cached = self.move_cache[player]
+        if cached is None or cached[0] != self.version:
+            opponent = 2 if player == 1 else 1
+            moves = bitboard.get_moves(self.bitboards[player], self.bitboards[opponent], self.geometry)
+            cached = self.move_cache[player] = [self.version, moves, None]
+        return cached[1]
+
+    def get_valid_moves(self, player):
+        # The list is cached too; callers must not modify it
+        moves = self.valid_move_bits(player)
+        cached = self.move_cache[player]
+        if cached[2] is None:
+            cached[2] = bitboard.to_squares(moves, self.size)
+        return cached[2]
+
+    def place_tile(self, row, col):
+        # A move made in play; unlike make_move it is recorded
+        return self.play((row, col)) is not None
+
+    def play(self, move):
+        # A recorded move for move_history.MoveHistory: (row, col), or None
+        # to pass. Returns the delta take_back needs, or None if illegal; a
+        # pass is only legal without a move to make.
+        if move is None:
+            if self.has_valid_moves(self.current_player):
+                return None
+            return self.make_pass()
+        undo = self.make_move(*move)
+        if undo is not None and self.recorder is not None:
+            self.recorder.move(move[0] * self.size + move[1])
+        return undo
+
+    def take_back(self, undo):
+        self.unmake_move(undo)
+        if undo[0] and self.recorder is not None:
+            self.recorder.take_back()
+
+    def make_move(self, row, col):
+        # Plays a move for the current player and returns the record that
+        # unmake_move needs to take it back, or None if the move is illegal
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            return None
+
+        player = self.current_player
+        opponent = 2 if player == 1 else 1
+        move_index = row * self.size + col
+        move_bit = 1 << move_index
+        tiles_to_flip = bitboard.get_flips(self.bitboards[player], self.bitboards[opponent], move_bit, self.geometry)
+        if not tiles_to_flip:
+            return None
+        undo = (move_bit, tiles_to_flip, self.hash)
+
+        # Place the tile and flip captured tiles
+        self.bitboards[player] |= move_bit | tiles_to_flip
+        self.bitboards[opponent] &= ~tiles_to_flip
+        self.version += 1
+        self.hash ^= bitboard.zobrist_move(player, move_index, tiles_to_flip, self.geometry)
+        if self.patterns is not None:
+            self.patterns.move(player, move_index, tiles_to_flip)
+
+        # Switch players
+        self.current_player = opponent
+        return undo
+
+    def make_pass(self):
+        # Hands the turn to the opponent without placing a tile
+        undo = (0, 0, self.hash)
+        self.hash ^= self.geometry.zobrist_side
+        self.current_player = 2 if self.current_player == 1 else 1
+        return undo
+
+    def unmake_move(self, undo):
+        move_bit, tiles_to_flip, previous_hash = undo
+        opponent = self.current_player
+        player = 2 if opponent == 1 else 1
+        if move_bit:
+            self.bitboards[player] &= ~(move_bit | tiles_to_flip)
+            self.bitboards[opponent] |= tiles_to_flip
+            self.version += 1
+            if self.patterns is not None:
+                self.patterns.undo()
+        self.hash = previous_hash
+        self.current_player = player
+
+    def snapshot(self):
+        # The whole position in a few ints, for restore()
+        return self.bitboards[1], self.bitboards[2], self.current_player, self.hash
+
+    def restore(self, state):
+        self.bitboards[1], self.bitboards[2], self.current_player, self.hash = state
+        self.version += 1
+        if self.patterns is not None:
+            self.patterns.reset(self.bitboards[1], self.bitboards[2])
+
+    def get_winner(self):
+        black_count = bitboard.count(self.bitboards[1])
+        white_count = bitboard.count(self.bitboards[2])
+        if black_count > white_count:
+            return "Black wins!"
+        elif white_count > black_count:
+            return "White wins!"
+        else:
+            return "It's a tie!"
+
+    def has_valid_moves(self, player):
+        # Uses the cached moves when there are any, otherwise stops at the
+        # first legal move found
+        cached = self.move_cache[player]
+        if cached is not None and cached[0] == self.version:
+            return cached[1] != 0
+        cached = self.any_move_cache[player]
+        if cached is None or cached[0] != self.version:
+            opponent = 2 if player == 1 else 1
+            found = bitboard.has_moves(self.bitboards[player], self.bitboards[opponent], self.geometry)
+            cached = self.any_move_cache[player] = (self.version, found)
+        return cached[1]
+
+    def is_game_over(self):
+        return not (self.has_valid_moves(1) or self.has_valid_moves(2))
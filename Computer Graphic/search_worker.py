@@ -0,0 +1,137 @@
+import multiprocessing
+import queue
+import time
+
+# Runs engine searches in a worker process so the pygame loop keeps
+# drawing and handling events while the computer thinks.
+#
+# A search function must accept `progress` and `stop` keyword arguments:
+# it calls progress(depth, move, score) after each finished iteration and
+# returns early once stop.is_set() becomes true.
+#
+# The worker stays up from one search to the next, so an engine a search
+# module keeps at module level (mcts keeps its tree there) carries over from
+# move to move. It is only restarted if it dies or ignores a cancel.
+
+CANCEL_TIME = 0.5  # seconds a cancelled search gets to stop before its worker is killed
+
+
+def _serve(tasks, results, stop):
+    # Worker loop: one search per task, until a None task
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        number, search, args = task
+
+        def progress(depth, move, score):
+            results.put(("progress", number, depth, move, score))
+
+        try:
+            move = search(*args, progress=progress, stop=stop)
+        except Exception as error:
+            results.put(("error", number, repr(error)))
+        else:
+            results.put(("done", number, move))
+
+
+class SearchScheduler:
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress  # called as on_progress(depth, move, score)
+        self.process = None
+        self.tasks = None
+        self.results = None
+        self.stop = None
+        self.number = 0  # of the current search; messages of older ones are dropped
+        self.searching = False  # a search was started and its result not taken yet
+        self.best_move = None
+        self.depth = 0
+        self.score = None
+        self.done = False
+        self.error = None  # message of a search that raised
+
+    @property
+    def running(self):
+        return self.searching and not self.done
+
+    def start(self, search, *args):
+        self.cancel()
+        if self.process is None:
+            self.tasks = multiprocessing.Queue()
+            self.results = multiprocessing.Queue()
+            self.stop = multiprocessing.Event()
+            self.process = multiprocessing.Process(target=_serve, args=(self.tasks, self.results, self.stop), daemon=True)
+            self.process.start()
+        self.stop.clear()
+        self.number += 1
+        self.searching = True
+        self.best_move = None
+        self.depth = 0
+        self.score = None
+        self.done = False
+        self.error = None
+        self.tasks.put((self.number, search, args))
+
+    def handle(self, message):
+        kind, number = message[0], message[1]
+        if number != self.number:
+            return
+        if kind == "progress":
+            _, _, self.depth, self.best_move, self.score = message
+            if self.on_progress is not None:
+                self.on_progress(self.depth, self.best_move, self.score)
+        else:
+            if kind == "error":
+                self.error = message[2]
+            elif message[2] is not None or self.best_move is None:
+                self.best_move = message[2]
+            self.done = True
+
+    def poll(self, timeout=0):
+        # Picks up any messages from the worker, waiting up to `timeout`
+        # seconds for the search to finish. Returns True once it has.
+        if not self.searching:
+            return False
+        deadline = time.monotonic() + timeout
+        while not self.done:
+            try:
+                wait = deadline - time.monotonic()
+                message = self.results.get(timeout=wait) if wait > 0 else self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.handle(message)
+        if not self.done and not self.process.is_alive():
+            self.error = "the worker died"
+            self.done = True
+            self.process = None
+        return self.done
+
+    def cancel(self):
+        # Stops the search and returns the best move found so far
+        if not self.searching:
+            return self.best_move
+        if not self.done:
+            self.stop.set()
+            if not self.poll(CANCEL_TIME):
+                self.kill()
+                self.done = True
+        self.searching = False
+        return self.best_move
+
+    def take_result(self):
+        # Returns the finished search's move and frees the worker
+        return self.cancel()
+
+    def kill(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def close(self):
+        # Cancels any search and shuts the worker down
+        self.cancel()
+        if self.process is not None:
+            self.tasks.put(None)
+            self.process.join(CANCEL_TIME)
+            self.kill()
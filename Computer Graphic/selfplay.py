@@ -0,0 +1,256 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import connect4_rules
+import reversi_bitboard as bitboard
+import reversi_patterns
+from connect4_ai import Connect4AI
+from connect4_rules import create_board, drop_piece, get_next_available_row, is_valid_location, winning_move
+from game_records import CONNECT4, REVERSI, GameRecord, RecordWriter
+from mcts import MCTS
+from reversi_ai import ReversiAI
+from reversi_rules import BOARD_SIZE, ReversiRules
+
+# Headless self-play: plays many games between pluggable agents across a
+# multiprocessing pool and streams one result row per game to JSONL or CSV.
+#
+#   python selfplay.py connect4 --games 10000 --agents random greedy --out results.jsonl
+#   python selfplay.py reversi --games 200 --agents search:3 random --format csv --out results.csv
+#   python selfplay.py connect4 --games 100000 --agents greedy random --out - --record games.rec > /dev/null
+
+VARIANTS = ("connect4", "reversi")
+PASS = -1  # recorded in place of a Reversi move when a player has to pass
+FIELDS = ["game_id", "variant", "player1", "player2", "winner", "plies", "moves", "seconds"]
+
+
+# Agents are called as agent(variant, position, player, rng) and return a
+# column for Connect Four or a (row, col) square for Reversi.
+
+def legal_moves(variant, position, player):
+    if variant == "connect4":
+        return [col for col in range(position.cols) if is_valid_location(position, col)]
+    return position.get_valid_moves(player)
+
+
+def random_agent(variant, position, player, rng):
+    return rng.choice(legal_moves(variant, position, player))
+
+
+def greedy_agent(variant, position, player, rng):
+    # Connect Four: win if possible, else block, else random.
+    # Reversi: the move that flips the most discs.
+    if variant == "connect4":
+        playable = position.playable_cells()
+        for piece in (player, 3 - player):
+            cells = position.threat_cells(piece) & playable
+            if cells:
+                return position.coords((cells & -cells).bit_length() - 1)[1]
+        return random_agent(variant, position, player, rng)
+
+    mine, theirs = position.bitboards[player], position.bitboards[3 - player]
+    moves = legal_moves(variant, position, player)
+    flips = [bitboard.get_flips(mine, theirs, bitboard.square_bit(row, col, position.size), position.geometry).bit_count() for row, col in moves]
+    best = max(flips)
+    return rng.choice([move for move, count in zip(moves, flips) if count == best])
+
+
+class SearchAgent:
+    # Alpha-beta engines from connect4_ai / reversi_ai at a fixed depth;
+    # with reversi_patterns weights the Reversi engine uses the learned evaluation
+    def __init__(self, depth=4, time_limit=5.0, weights=None):
+        self.depth = depth
+        self.time_limit = time_limit
+        self.weights = weights
+        self.engines = {}
+
+    def __call__(self, variant, position, player, rng):
+        if variant not in self.engines:
+            self.engines[variant] = Connect4AI() if variant == "connect4" else ReversiAI(weights=self.weights)
+        engine = self.engines[variant]
+        if variant == "connect4":
+            return engine.get_move(position, player, self.time_limit, max_depth=self.depth)
+        return engine.get_move(position, self.time_limit, max_depth=self.depth)
+
+
+class MCTSAgent:
+    # UCT with a fixed number of playouts per move; one process, since the
+    # games already run in a pool
+    def __init__(self, playouts=1000, time_limit=5.0):
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.engine = None
+
+    def __call__(self, variant, position, player, rng):
+        if self.engine is None:
+            self.engine = MCTS(seed=rng.getrandbits(32))
+        return self.engine.get_move(position, player, self.time_limit, playouts=self.playouts)
+
+
+AGENTS = {
+    "random": lambda arg: random_agent,
+    "greedy": lambda arg: greedy_agent,
+    "search": lambda arg: SearchAgent(int(arg) if arg else 4),
+    "patterns": lambda arg: SearchAgent(int(arg) if arg else 4, weights=reversi_patterns.weights()),
+    "mcts": lambda arg: MCTSAgent(int(arg) if arg else 1000),
+}
+
+
+def make_agent(spec):
+    # "name" or "name:argument", e.g. "search:3"
+    name, _, arg = spec.partition(":")
+    if name not in AGENTS:
+        raise ValueError(f"unknown agent {name!r}, expected one of {', '.join(AGENTS)}")
+    return AGENTS[name](arg)
+
+
+def play_connect4(agents, rng):
+    board = create_board()
+    moves = []
+    piece = 1
+    winner = 0
+    while True:
+        if not board.playable_cells():
+            break  # board full, draw
+        col = agents[piece - 1]("connect4", board, piece, rng)
+        drop_piece(board, get_next_available_row(board, col), col, piece)
+        moves.append(col)
+        if winning_move(board, piece):
+            winner = piece
+            break
+        piece = 3 - piece
+    return winner, moves
+
+
+def play_reversi(agents, rng):
+    game = ReversiRules()
+    moves = []
+    while not game.is_game_over():
+        player = game.current_player
+        if not game.has_valid_moves(player):
+            game.make_pass()
+            moves.append(PASS)
+            continue
+        row, col = agents[player - 1]("reversi", game, player, rng)
+        game.place_tile(row, col)
+        moves.append(row * game.size + col)
+    black, white = game.bitboards[1].bit_count(), game.bitboards[2].bit_count()
+    winner = 1 if black > white else 2 if white > black else 0
+    return winner, moves
+
+
+_agent_cache = {}
+
+
+def play_task(task):
+    # Runs in a pool worker; agents are built once per worker and reused
+    game_id, variant, specs, seed = task
+    agents = []
+    for spec in specs:
+        if spec not in _agent_cache:
+            _agent_cache[spec] = make_agent(spec)
+        agents.append(_agent_cache[spec])
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    if variant == "connect4":
+        winner, moves = play_connect4(agents, rng)
+    else:
+        winner, moves = play_reversi(agents, rng)
+    return {
+        "game_id": game_id,
+        "variant": variant,
+        "player1": specs[0],
+        "player2": specs[1],
+        "winner": winner,
+        "plies": len(moves),
+        "moves": moves,
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+def iter_tasks(variant, specs, games, seed, alternate):
+    for game_id in range(games):
+        order = specs if not alternate or game_id % 2 == 0 else specs[::-1]
+        yield game_id, variant, tuple(order), seed + game_id
+
+
+def to_record(result):
+    # Compact game record of a result row, for game_records archives
+    if result["variant"] == "connect4":
+        header = (CONNECT4, connect4_rules.no_row, connect4_rules.COLUMN_COUNT, connect4_rules.CONNECT)
+    else:
+        header = (REVERSI, BOARD_SIZE, BOARD_SIZE, 0)
+    moves = bytes(move for move in result["moves"] if move != PASS)
+    return GameRecord(*header, result["winner"], moves, None)
+
+
+def run(variant, specs, games, processes=None, out=sys.stdout, fmt="jsonl", seed=0, alternate=False, record=None):
+    # Plays `games` games and writes each result as soon as it arrives,
+    # also appending it to the `record` archive if given.
+    # Returns the number of wins per agent spec plus draws.
+    if variant not in VARIANTS:
+        raise ValueError(f"unknown variant {variant!r}, expected one of {', '.join(VARIANTS)}")
+    for spec in specs:
+        make_agent(spec)  # fail fast on a bad spec
+
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+
+    tally = {spec: 0 for spec in specs}
+    tally["draw"] = 0
+    processes = processes or multiprocessing.cpu_count()
+    chunksize = max(1, min(256, games // (processes * 8)))
+    archive = RecordWriter(record) if record is not None else None
+    with multiprocessing.Pool(processes) as pool:
+        tasks = iter_tasks(variant, specs, games, seed, alternate)
+        for result in pool.imap_unordered(play_task, tasks, chunksize):
+            if archive is not None:
+                archive.write(to_record(result))
+            if result["winner"]:
+                tally[result["player" + str(result["winner"])]] += 1
+            else:
+                tally["draw"] += 1
+            if writer is not None:
+                writer.writerow(dict(result, moves=" ".join(map(str, result["moves"]))))
+            else:
+                out.write(json.dumps(result) + "\n")
+    if archive is not None:
+        archive.close()
+    return tally
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play between game agents")
+    parser.add_argument("variant", choices=VARIANTS)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--agents", nargs=2, default=["random", "random"], metavar=("PLAYER1", "PLAYER2"),
+                        help="agent specs: random, greedy, search[:depth], patterns[:depth] or mcts[:playouts]")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--out", default="-", help="output file, - for stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--alternate", action="store_true", help="swap sides every other game")
+    parser.add_argument("--record", help="also append the games to this game record archive")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    start = time.perf_counter()
+    try:
+        tally = run(args.variant, args.agents, args.games, args.processes, out, args.format, args.seed, args.alternate,
+                    args.record)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed * 60:.0f} games/min): {tally}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()